@@ -10,15 +10,38 @@ Date: October 2025
 
 Usage:
     python atc_to_ndc_converter.py <ATC_CODE>
-    or import and use the ATCtoNDCConverter class
+    or import and use the ATCtoNDCConverter / AsyncATCtoNDCConverter classes
 """
 
+import asyncio
+import functools
+import httpx
 import requests
 import json
+import os
+import sqlite3
 import sys
-from typing import List, Dict, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Dict, Optional
 from dataclasses import dataclass
 
+from rxnav_cache import DEFAULT_CACHE_TTL, ResponseCache
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, fall back to the standard library
+    orjson = None
+
+
+# Point at a local rxnav_proxy.py (e.g. http://127.0.0.1:8765/REST) to reuse
+# its warm upstream connections across CLI invocations
+RXNAV_BASE_URL = os.environ.get("RXNAV_BASE_URL", "https://rxnav.nlm.nih.gov/REST").rstrip('/')
+
+DEFAULT_SNAPSHOT_PATH = Path(__file__).resolve().parent.parent / "mappings" / "data" / "atc_ndc_snapshot.sqlite"
+NDC_BATCH_SIZE = 20  # RxCUIs per /ndcproperties.json request
+
 
 @dataclass
 class DrugInfo:
@@ -27,11 +50,178 @@ class DrugInfo:
     rxcui: Optional[str]
     drug_name: Optional[str]
     ndc_codes: List[str]
+    # Set when an API lookup failed, so ndc_codes (or drug_name) may be incomplete
+    lookup_failed: bool = False
     
     def __str__(self):
         return f"ATC: {self.atc_code}, RxCUI: {self.rxcui}, Drug: {self.drug_name}, NDCs: {len(self.ndc_codes)}"
 
 
+def _loads(data: bytes):
+    """
+    Parse a JSON response body, using orjson when it is installed.
+    
+    A malformed body raises ValueError (both decoders' JSONDecodeError
+    subclass it), which the lookup methods catch next to request errors.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class ATCNDCSnapshot:
+    """
+    Read-only table of precomputed ATC to NDC conversions.
+    
+    Built offline by build_atc_ndc_snapshot.py, which converts every known
+    ATC code with related drug forms included. Looking a code
+    up is a local indexed query, so converters consult the snapshot first
+    and only call the API for codes it does not contain. Safe to share
+    between threads.
+    """
+    
+    def __init__(self, path: Optional[Path] = None):
+        """
+        Open the snapshot database.
+        
+        Args:
+            path: SQLite file to read (default: mappings/data/atc_ndc_snapshot.sqlite)
+        """
+        self.path = Path(path) if path else DEFAULT_SNAPSHOT_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True,
+                                     check_same_thread=False)
+    
+    @classmethod
+    def open_default(cls) -> Optional['ATCNDCSnapshot']:
+        """Open the default snapshot, or return None if it has not been built"""
+        if not DEFAULT_SNAPSHOT_PATH.exists():
+            return None
+        return cls(DEFAULT_SNAPSHOT_PATH)
+    
+    def get(self, atc_code: str) -> Optional[DrugInfo]:
+        """Return the stored conversion for atc_code, or None if it is not in the snapshot"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT rxcui, drug_name FROM drugs WHERE atc_code = ?", (atc_code,)
+            ).fetchone()
+            if row is None:
+                return None
+            ndc_codes = [ndc for (ndc,) in self._conn.execute(
+                "SELECT ndc_code FROM ndcs WHERE atc_code = ? ORDER BY position", (atc_code,)
+            )]
+        return DrugInfo(atc_code=atc_code, rxcui=row[0], drug_name=row[1], ndc_codes=ndc_codes)
+    
+    @staticmethod
+    def write(path: Path, results: List[DrugInfo]) -> int:
+        """
+        Write conversions to a new snapshot file, replacing any existing one.
+        
+        Args:
+            path: SQLite file to create
+            results: Conversions to store; codes without an RxCUI, or whose
+                lookups failed (lookup_failed), are skipped
+            
+        Returns:
+            Number of ATC codes stored
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        if tmp_path.exists():
+            tmp_path.unlink()
+        
+        # A failed lookup would otherwise be served from the snapshot until
+        # the next rebuild, so those codes are left to the API instead
+        found = [info for info in results if info.rxcui and not info.lookup_failed]
+        conn = sqlite3.connect(str(tmp_path))
+        conn.executescript("""
+            CREATE TABLE drugs (atc_code TEXT PRIMARY KEY, rxcui TEXT, drug_name TEXT) WITHOUT ROWID;
+            CREATE TABLE ndcs (atc_code TEXT, position INTEGER, ndc_code TEXT,
+                               PRIMARY KEY (atc_code, position)) WITHOUT ROWID;
+        """)
+        with conn:
+            conn.executemany(
+                "INSERT INTO drugs (atc_code, rxcui, drug_name) VALUES (?, ?, ?)",
+                ((info.atc_code, info.rxcui, info.drug_name) for info in found)
+            )
+            conn.executemany(
+                "INSERT INTO ndcs (atc_code, position, ndc_code) VALUES (?, ?, ?)",
+                ((info.atc_code, i, ndc) for info in found for i, ndc in enumerate(info.ndc_codes))
+            )
+        conn.close()
+        
+        os.replace(tmp_path, path)
+        return len(found)
+    
+    def close(self):
+        self._conn.close()
+
+
+def _parse_rxcuis(data: Dict) -> List[str]:
+    """Extract RxCUIs from a /rxcui.json response"""
+    return data.get('idGroup', {}).get('rxnormId', [])
+
+
+def _parse_drug_name(data: Dict) -> Optional[str]:
+    """Extract the drug name from a /properties.json response"""
+    return data.get('properties', {}).get('name')
+
+
+def _parse_ndcs(data: Dict) -> List[str]:
+    """Extract NDC codes from a /ndcs.json response"""
+    return data.get('ndcGroup', {}).get('ndcList', {}).get('ndc', [])
+
+
+def _parse_ndc_properties(data: Dict, rxcuis: List[str]) -> List[str]:
+    """
+    Extract NDC codes from a multi-id /ndcproperties.json response.
+    
+    NDCs are grouped by RxCUI in the order of rxcuis, so the result matches
+    what a sequence of per-RxCUI /ndcs.json calls would have returned.
+    """
+    by_rxcui = {rxcui: [] for rxcui in rxcuis}
+    properties = (data.get('ndcPropertyList') or {}).get('ndcProperty', [])
+    
+    for prop in properties:
+        ndcs = by_rxcui.get(prop.get('rxcui'))
+        if ndcs is not None and prop.get('ndcItem'):
+            ndcs.append(prop['ndcItem'])
+    
+    return [ndc for rxcui in rxcuis for ndc in by_rxcui[rxcui]]
+
+
+def _merge_unique(ndc_lists: Iterable[List[str]]) -> List[str]:
+    """Concatenate NDC lists, dropping repeated codes as they are encountered"""
+    seen = set()
+    merged = []
+    for ndcs in ndc_lists:
+        for ndc in ndcs:
+            if ndc not in seen:
+                seen.add(ndc)
+                merged.append(ndc)
+    return merged
+
+
+def _chunks(items: List[str], size: int = NDC_BATCH_SIZE) -> List[List[str]]:
+    """Split items into lists of at most size elements"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _parse_related_rxcuis(data: Dict, rxcui: str) -> List[str]:
+    """Extract related RxCUIs (excluding rxcui itself) from a /related.json response"""
+    related = []
+    concept_group = data.get('relatedGroup', {}).get('conceptGroup', [])
+    
+    for group in concept_group:
+        properties = group.get('conceptProperties', [])
+        for prop in properties:
+            related_rxcui = prop.get('rxcui')
+            if related_rxcui and related_rxcui != rxcui:
+                related.append(related_rxcui)
+    
+    return related
+
+
 class ATCtoNDCConverter:
     """
     Converts ATC codes to NDC codes using the RxNorm API.
@@ -42,29 +232,72 @@ class ATCtoNDCConverter:
     3. Optionally get drug names and additional information
     """
     
-    BASE_URL = "https://rxnav.nlm.nih.gov/REST"
+    BASE_URL = RXNAV_BASE_URL
     
-    def __init__(self, verbose: bool = False):
+    def __init__(self, verbose: bool = False, cache: Optional[ResponseCache] = None,
+                 max_workers: int = 8, snapshot: Optional[ATCNDCSnapshot] = None):
         """
         Initialize the converter.
         
         Args:
             verbose: If True, print detailed information during conversion
+            cache: Optional ResponseCache used to skip repeated API calls
+            max_workers: Maximum number of threads issuing API calls at once
+            snapshot: Optional ATCNDCSnapshot answering known codes without API calls
         """
         self.verbose = verbose
+        self.cache = cache
+        self.snapshot = snapshot
+        self.max_workers = max_workers
+        self._log_lock = threading.Lock()
         self.session = requests.Session()
+        # Room for one keep-alive connection per worker thread
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, max_workers))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
     def _log(self, message: str):
         """Print message if verbose mode is enabled"""
         if self.verbose:
-            print(f"[INFO] {message}")
+            with self._log_lock:
+                print(f"[INFO] {message}")
     
-    def get_rxcui_from_atc(self, atc_code: str) -> List[str]:
+    def _cached_get(self, url: str) -> Dict:
+        """GET a URL and decode the JSON body, going through the cache if set"""
+        if self.cache is None:
+            response = self.session.get(url, timeout=10)
+            response.raise_for_status()
+            return _loads(response.content)
+        
+        body = self.cache.get(url)
+        if body is not None:
+            self._log(f"Cache hit: {url}")
+            return _loads(body)
+        
+        # Expired entries are revalidated instead of downloaded again
+        response = self.session.get(url, headers=self.cache.validators(url), timeout=10)
+        if response.status_code == 304:
+            body = self.cache.refresh(url)
+            if body is not None:
+                self._log(f"Not modified: {url}")
+                return _loads(body)
+            response = self.session.get(url, timeout=10)
+        
+        response.raise_for_status()
+        # Decoded first so a malformed body is never cached
+        data = _loads(response.content)
+        self.cache.set(url, response.content,
+                       response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return data
+    
+    def get_rxcui_from_atc(self, atc_code: str,
+                           errors: Optional[List[Exception]] = None) -> List[str]:
         """
         Get RxCUI(s) from an ATC code.
         
         Args:
             atc_code: The ATC code (e.g., 'C10AA07')
+            errors: Optional list that a caught API error is appended to
             
         Returns:
             List of RxCUI identifiers
@@ -74,12 +307,10 @@ class ATCtoNDCConverter:
         url = f"{self.BASE_URL}/rxcui.json?idtype=ATC&id={atc_code}"
         
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._cached_get(url)
             
             # Extract RxCUI from response
-            rxcuis = data.get('idGroup', {}).get('rxnormId', [])
+            rxcuis = _parse_rxcuis(data)
             
             if rxcuis:
                 self._log(f"Found {len(rxcuis)} RxCUI(s): {rxcuis}")
@@ -88,16 +319,20 @@ class ATCtoNDCConverter:
                 
             return rxcuis
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if errors is not None:
+                errors.append(e)
             print(f"Error querying RxNorm API: {e}")
             return []
     
-    def get_drug_name(self, rxcui: str) -> Optional[str]:
+    def get_drug_name(self, rxcui: str,
+                      errors: Optional[List[Exception]] = None) -> Optional[str]:
         """
         Get the drug name for an RxCUI.
         
         Args:
             rxcui: The RxNorm Concept Unique Identifier
+            errors: Optional list that a caught API error is appended to
             
         Returns:
             Drug name or None if not found
@@ -105,19 +340,18 @@ class ATCtoNDCConverter:
         url = f"{self.BASE_URL}/rxcui/{rxcui}/properties.json"
         
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._cached_get(url)
             
-            properties = data.get('properties', {})
-            name = properties.get('name')
+            name = _parse_drug_name(data)
             
             if name:
                 self._log(f"Drug name for RxCUI {rxcui}: {name}")
                 
             return name
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if errors is not None:
+                errors.append(e)
             self._log(f"Error getting drug name: {e}")
             return None
     
@@ -136,12 +370,10 @@ class ATCtoNDCConverter:
         url = f"{self.BASE_URL}/rxcui/{rxcui}/ndcs.json"
         
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._cached_get(url)
             
             # Extract NDC codes from response
-            ndc_list = data.get('ndcGroup', {}).get('ndcList', {}).get('ndc', [])
+            ndc_list = _parse_ndcs(data)
             
             if ndc_list:
                 self._log(f"Found {len(ndc_list)} NDC code(s)")
@@ -150,17 +382,59 @@ class ATCtoNDCConverter:
                 
             return ndc_list
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error querying RxNorm API: {e}")
+            return []
+    
+    def get_ndcs_from_rxcuis(self, rxcuis: List[str],
+                             errors: Optional[List[Exception]] = None) -> List[str]:
+        """
+        Get the NDC codes of several RxCUIs with one request per batch.
+        
+        Uses the multi-id form of /ndcproperties.json, so a conversion with
+        ten related RxCUIs costs one round-trip instead of eleven.
+        
+        Args:
+            rxcuis: RxNorm Concept Unique Identifiers
+            errors: Optional list that caught API errors are appended to
+            
+        Returns:
+            List of unique NDC codes, grouped by RxCUI in input order
+        """
+        batches = _chunks(rxcuis)
+        if not batches:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            return _merge_unique(executor.map(functools.partial(self._get_ndc_batch, errors=errors), batches))
+    
+    def _get_ndc_batch(self, rxcuis: List[str],
+                       errors: Optional[List[Exception]] = None) -> List[str]:
+        """Fetch the NDC codes of at most NDC_BATCH_SIZE RxCUIs"""
+        self._log(f"Looking up NDC codes for RxCUIs: {rxcuis}")
+        
+        url = f"{self.BASE_URL}/ndcproperties.json?id={'+'.join(rxcuis)}"
+        
+        try:
+            ndc_list = _parse_ndc_properties(self._cached_get(url), rxcuis)
+            self._log(f"Found {len(ndc_list)} NDC code(s)")
+            return ndc_list
+            
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if errors is not None:
+                errors.append(e)
             print(f"Error querying RxNorm API: {e}")
             return []
     
-    def get_related_rxcuis(self, rxcui: str) -> List[str]:
+    def get_related_rxcuis(self, rxcui: str,
+                           errors: Optional[List[Exception]] = None) -> List[str]:
         """
         Get related RxCUIs that might have additional NDC codes.
         This includes different dose forms and strengths.
         
         Args:
             rxcui: The RxNorm Concept Unique Identifier
+            errors: Optional list that a caught API error is appended to
             
         Returns:
             List of related RxCUI identifiers
@@ -170,26 +444,18 @@ class ATCtoNDCConverter:
         url = f"{self.BASE_URL}/rxcui/{rxcui}/related.json?tty=SCD+SBD+GPCK+BPCK"
         
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            related = []
-            concept_group = data.get('relatedGroup', {}).get('conceptGroup', [])
+            data = self._cached_get(url)
             
-            for group in concept_group:
-                properties = group.get('conceptProperties', [])
-                for prop in properties:
-                    related_rxcui = prop.get('rxcui')
-                    if related_rxcui and related_rxcui != rxcui:
-                        related.append(related_rxcui)
+            related = _parse_related_rxcuis(data, rxcui)
             
             if related:
                 self._log(f"Found {len(related)} related RxCUI(s)")
                 
             return related
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if errors is not None:
+                errors.append(e)
             self._log(f"Error getting related RxCUIs: {e}")
             return []
     
@@ -209,51 +475,54 @@ class ATCtoNDCConverter:
         
         self._log(f"Starting conversion for ATC code: {atc_code}")
         
+        # The snapshot is built with related forms, so it only answers those queries
+        if include_related and self.snapshot is not None:
+            snapshot_info = self.snapshot.get(atc_code)
+            if snapshot_info is not None:
+                self._log(f"Found {atc_code} in snapshot")
+                return snapshot_info
+        
+        # API errors are collected here and flagged on the result
+        errors = []
+        
         # Step 1: Get RxCUI(s) from ATC code
-        rxcuis = self.get_rxcui_from_atc(atc_code)
+        rxcuis = self.get_rxcui_from_atc(atc_code, errors)
         
         if not rxcuis:
             return DrugInfo(
                 atc_code=atc_code,
                 rxcui=None,
                 drug_name=None,
-                ndc_codes=[]
+                ndc_codes=[],
+                lookup_failed=bool(errors)
             )
         
         # Use the first RxCUI as primary
         primary_rxcui = rxcuis[0]
         
         # Step 2: Get drug name
-        drug_name = self.get_drug_name(primary_rxcui)
+        drug_name = self.get_drug_name(primary_rxcui, errors)
         
-        # Step 3: Get NDC codes
-        all_ndc_codes = []
-        
-        # Get NDCs for all returned RxCUIs
-        for rxcui in rxcuis:
-            ndcs = self.get_ndcs_from_rxcui(rxcui)
-            all_ndc_codes.extend(ndcs)
-        
-        # Step 4: Optionally get NDCs from related drug forms
+        # Step 3: Optionally find related drug forms
+        related_rxcuis = []
         if include_related:
-            related_rxcuis = self.get_related_rxcuis(primary_rxcui)
-            for rxcui in related_rxcuis[:10]:  # Limit to 10 related to avoid too many results
-                ndcs = self.get_ndcs_from_rxcui(rxcui)
-                all_ndc_codes.extend(ndcs)
+            # Limit to 10 related to avoid too many results
+            related_rxcuis = self.get_related_rxcuis(primary_rxcui, errors)[:10]
         
-        # Remove duplicates while preserving order
-        all_ndc_codes = list(dict.fromkeys(all_ndc_codes))
+        # Step 4: Get unique NDC codes for all returned and related RxCUIs in one batch
+        all_ndc_codes = self.get_ndcs_from_rxcuis(list(dict.fromkeys(rxcuis + related_rxcuis)), errors)
         
         return DrugInfo(
             atc_code=atc_code,
             rxcui=primary_rxcui,
             drug_name=drug_name,
-            ndc_codes=all_ndc_codes
+            ndc_codes=all_ndc_codes,
+            lookup_failed=bool(errors)
         )
     
     def convert_batch(self, atc_codes: List[str], include_related: bool = True) -> List[DrugInfo]:
         """
-        Convert multiple ATC codes to NDC codes.
+        Convert multiple ATC codes to NDC codes in parallel threads.
         
         Args:
             atc_codes: List of ATC codes to convert
@@ -262,18 +531,401 @@ class ATCtoNDCConverter:
         Returns:
             List of DrugInfo objects
         """
-        results = []
-        for i, atc_code in enumerate(atc_codes, 1):
+        if not atc_codes:
+            return []
+        
+        def convert_one(item) -> DrugInfo:
+            i, atc_code = item
             self._log(f"\n--- Processing {i}/{len(atc_codes)} ---")
-            result = self.convert(atc_code, include_related)
-            results.append(result)
-        return results
+            return self.convert(atc_code, include_related)
+        
+        # Codes are converted on a bounded thread pool; map() keeps input order
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(atc_codes))) as executor:
+            return list(executor.map(convert_one, enumerate(atc_codes, 1)))
 
 
+class AsyncATCtoNDCConverter:
+    """
+    Asynchronous ATC to NDC converter built on httpx.
+    
+    Performs the same lookups as ATCtoNDCConverter, but the independent
+    requests of a conversion (and the conversions of a batch) are issued
+    concurrently, so wall time follows the slowest request instead of the
+    sum of all of them. Requests are multiplexed over HTTP/2, so after the
+    first call they share one TLS connection to rxnav.nlm.nih.gov.
+    
+    Must be used as an async context manager:
+    
+        async with AsyncATCtoNDCConverter() as converter:
+            result = await converter.convert('C10AA07')
+    """
+    
+    BASE_URL = RXNAV_BASE_URL
+    
+    def __init__(self, verbose: bool = False, max_concurrency: int = 8,
+                 cache: Optional[ResponseCache] = None,
+                 snapshot: Optional[ATCNDCSnapshot] = None):
+        """
+        Initialize the converter.
+        
+        Args:
+            verbose: If True, print detailed information during conversion
+            max_concurrency: Maximum number of ATC codes converted at once by convert_batch
+            cache: Optional ResponseCache used to skip repeated API calls
+            snapshot: Optional ATCNDCSnapshot answering known codes without API calls
+        """
+        self.verbose = verbose
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.snapshot = snapshot
+        self.client: Optional[httpx.AsyncClient] = None
+    
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            http2=True,
+            base_url=self.BASE_URL,
+            timeout=10,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32)
+        )
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.client.aclose()
+        self.client = None
+    
+    def _log(self, message: str):
+        """Print message if verbose mode is enabled"""
+        if self.verbose:
+            print(f"[INFO] {message}")
+    
+    async def _cached_get(self, path: str) -> Dict:
+        """GET an API path and decode the JSON body, going through the cache if set"""
+        # Keyed by the full URL so the cache is shared with ATCtoNDCConverter.
+        # Cache reads are local SQLite lookups (well under a millisecond),
+        # so they are done inline rather than in an executor
+        if self.cache is None:
+            response = await self.client.get(path)
+            response.raise_for_status()
+            return _loads(response.content)
+        
+        url = f"{self.BASE_URL}{path}"
+        body = self.cache.get(url)
+        if body is not None:
+            self._log(f"Cache hit: {url}")
+            return _loads(body)
+        
+        # Expired entries are revalidated instead of downloaded again
+        response = await self.client.get(path, headers=self.cache.validators(url))
+        if response.status_code == 304:
+            body = self.cache.refresh(url)
+            if body is not None:
+                self._log(f"Not modified: {url}")
+                return _loads(body)
+            response = await self.client.get(path)
+        
+        response.raise_for_status()
+        # Decoded first so a malformed body is never cached
+        data = _loads(response.content)
+        self.cache.set(url, response.content,
+                       response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return data
+    
+    async def get_rxcui_from_atc(self, atc_code: str,
+                                 errors: Optional[List[Exception]] = None) -> List[str]:
+        """
+        Get RxCUI(s) from an ATC code.
+        
+        Args:
+            atc_code: The ATC code (e.g., 'C10AA07')
+            errors: Optional list that a caught API error is appended to
+            
+        Returns:
+            List of RxCUI identifiers
+        """
+        self._log(f"Looking up RxCUI for ATC code: {atc_code}")
+        
+        path = f"/rxcui.json?idtype=ATC&id={atc_code}"
+        
+        try:
+            rxcuis = _parse_rxcuis(await self._cached_get(path))
+            
+            if rxcuis:
+                self._log(f"Found {len(rxcuis)} RxCUI(s): {rxcuis}")
+            else:
+                self._log(f"No RxCUI found for ATC code: {atc_code}")
+                
+            return rxcuis
+            
+        except (httpx.HTTPError, ValueError) as e:
+            if errors is not None:
+                errors.append(e)
+            print(f"Error querying RxNorm API: {e}")
+            return []
+    
+    async def get_drug_name(self, rxcui: str,
+                            errors: Optional[List[Exception]] = None) -> Optional[str]:
+        """
+        Get the drug name for an RxCUI.
+        
+        Args:
+            rxcui: The RxNorm Concept Unique Identifier
+            errors: Optional list that a caught API error is appended to
+            
+        Returns:
+            Drug name or None if not found
+        """
+        path = f"/rxcui/{rxcui}/properties.json"
+        
+        try:
+            name = _parse_drug_name(await self._cached_get(path))
+            
+            if name:
+                self._log(f"Drug name for RxCUI {rxcui}: {name}")
+                
+            return name
+            
+        except (httpx.HTTPError, ValueError) as e:
+            if errors is not None:
+                errors.append(e)
+            self._log(f"Error getting drug name: {e}")
+            return None
+    
+    async def get_ndcs_from_rxcui(self, rxcui: str) -> List[str]:
+        """
+        Get all NDC codes associated with an RxCUI.
+        
+        Args:
+            rxcui: The RxNorm Concept Unique Identifier
+            
+        Returns:
+            List of NDC codes
+        """
+        self._log(f"Looking up NDC codes for RxCUI: {rxcui}")
+        
+        path = f"/rxcui/{rxcui}/ndcs.json"
+        
+        try:
+            ndc_list = _parse_ndcs(await self._cached_get(path))
+            
+            if ndc_list:
+                self._log(f"Found {len(ndc_list)} NDC code(s) for RxCUI: {rxcui}")
+            else:
+                self._log(f"No NDC codes found for RxCUI: {rxcui}")
+                
+            return ndc_list
+            
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Error querying RxNorm API: {e}")
+            return []
+    
+    async def get_ndcs_from_rxcuis(self, rxcuis: List[str],
+                                   errors: Optional[List[Exception]] = None) -> List[str]:
+        """
+        Get the NDC codes of several RxCUIs with one request per batch.
+        
+        Args:
+            rxcuis: RxNorm Concept Unique Identifiers
+            errors: Optional list that caught API errors are appended to
+            
+        Returns:
+            List of unique NDC codes, grouped by RxCUI in input order
+        """
+        ndc_lists = await asyncio.gather(*(self._get_ndc_batch(batch, errors) for batch in _chunks(rxcuis)))
+        return _merge_unique(ndc_lists)
+    
+    async def _get_ndc_batch(self, rxcuis: List[str],
+                             errors: Optional[List[Exception]] = None) -> List[str]:
+        """Fetch the NDC codes of at most NDC_BATCH_SIZE RxCUIs"""
+        self._log(f"Looking up NDC codes for RxCUIs: {rxcuis}")
+        
+        path = f"/ndcproperties.json?id={'+'.join(rxcuis)}"
+        
+        try:
+            ndc_list = _parse_ndc_properties(await self._cached_get(path), rxcuis)
+            self._log(f"Found {len(ndc_list)} NDC code(s)")
+            return ndc_list
+            
+        except (httpx.HTTPError, ValueError) as e:
+            if errors is not None:
+                errors.append(e)
+            print(f"Error querying RxNorm API: {e}")
+            return []
+    
+    async def get_related_rxcuis(self, rxcui: str,
+                                 errors: Optional[List[Exception]] = None) -> List[str]:
+        """
+        Get related RxCUIs that might have additional NDC codes.
+        This includes different dose forms and strengths.
+        
+        Args:
+            rxcui: The RxNorm Concept Unique Identifier
+            errors: Optional list that a caught API error is appended to
+            
+        Returns:
+            List of related RxCUI identifiers
+        """
+        self._log(f"Looking up related RxCUIs for: {rxcui}")
+        
+        path = f"/rxcui/{rxcui}/related.json?tty=SCD+SBD+GPCK+BPCK"
+        
+        try:
+            related = _parse_related_rxcuis(await self._cached_get(path), rxcui)
+            
+            if related:
+                self._log(f"Found {len(related)} related RxCUI(s)")
+                
+            return related
+            
+        except (httpx.HTTPError, ValueError) as e:
+            if errors is not None:
+                errors.append(e)
+            self._log(f"Error getting related RxCUIs: {e}")
+            return []
+    
+    async def convert(self, atc_code: str, include_related: bool = True) -> DrugInfo:
+        """
+        Convert an ATC code to NDC codes.
+        
+        Args:
+            atc_code: The ATC code to convert (e.g., 'C10AA07')
+            include_related: If True, also search related drug forms for additional NDCs
+            
+        Returns:
+            DrugInfo object containing the conversion results
+        """
+        # Normalize ATC code (uppercase, no spaces)
+        atc_code = atc_code.strip().upper()
+        
+        self._log(f"Starting conversion for ATC code: {atc_code}")
+        
+        # The snapshot is built with related forms, so it only answers those queries
+        if include_related and self.snapshot is not None:
+            snapshot_info = self.snapshot.get(atc_code)
+            if snapshot_info is not None:
+                self._log(f"Found {atc_code} in snapshot")
+                return snapshot_info
+        
+        # API errors are collected here and flagged on the result
+        errors = []
+        
+        # Step 1: Get RxCUI(s) from ATC code
+        rxcuis = await self.get_rxcui_from_atc(atc_code, errors)
+        
+        if not rxcuis:
+            return DrugInfo(
+                atc_code=atc_code,
+                rxcui=None,
+                drug_name=None,
+                ndc_codes=[],
+                lookup_failed=bool(errors)
+            )
+        
+        # Use the first RxCUI as primary
+        primary_rxcui = rxcuis[0]
+        
+        # Step 2: Get drug name and related drug forms at the same time
+        lookups = [self.get_drug_name(primary_rxcui, errors)]
+        if include_related:
+            lookups.append(self.get_related_rxcuis(primary_rxcui, errors))
+        lookup_results = await asyncio.gather(*lookups)
+        
+        drug_name = lookup_results[0]
+        # Limit to 10 related to avoid too many results
+        related_rxcuis = lookup_results[1][:10] if include_related else []
+        
+        # Step 3: Get unique NDC codes for all RxCUIs in one batched request
+        all_ndc_codes = await self.get_ndcs_from_rxcuis(list(dict.fromkeys(rxcuis + related_rxcuis)), errors)
+        
+        return DrugInfo(
+            atc_code=atc_code,
+            rxcui=primary_rxcui,
+            drug_name=drug_name,
+            ndc_codes=all_ndc_codes,
+            lookup_failed=bool(errors)
+        )
+    
+    async def convert_batch(self, atc_codes: List[str], include_related: bool = True) -> List[DrugInfo]:
+        """
+        Convert multiple ATC codes to NDC codes concurrently.
+        
+        At most max_concurrency codes are in flight at once to stay polite
+        towards the RxNorm API. Results are returned in input order.
+        
+        Args:
+            atc_codes: List of ATC codes to convert
+            include_related: If True, also search related drug forms for additional NDCs
+            
+        Returns:
+            List of DrugInfo objects
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def convert_one(i: int, atc_code: str) -> DrugInfo:
+            async with semaphore:
+                self._log(f"\n--- Processing {i}/{len(atc_codes)} ---")
+                return await self.convert(atc_code, include_related)
+        
+        return list(await asyncio.gather(
+            *(convert_one(i, atc_code) for i, atc_code in enumerate(atc_codes, 1))
+        ))
+
+
+async def convert_codes_async(atc_codes: List[str], include_related: bool = True,
+                              verbose: bool = False,
+                              cache: Optional[ResponseCache] = None,
+                              max_concurrency: int = 8,
+                              snapshot: Optional[ATCNDCSnapshot] = None) -> List[DrugInfo]:
+    """
+    Convert ATC codes with a short-lived AsyncATCtoNDCConverter.
+    
+    Args:
+        atc_codes: List of ATC codes to convert
+        include_related: If True, also search related drug forms for additional NDCs
+        verbose: If True, print detailed information during conversion
+        cache: Optional ResponseCache used to skip repeated API calls
+        max_concurrency: Maximum number of ATC codes converted at once
+        snapshot: Optional ATCNDCSnapshot answering known codes without API calls
+        
+    Returns:
+        List of DrugInfo objects
+    """
+    async with AsyncATCtoNDCConverter(verbose=verbose, max_concurrency=max_concurrency,
+                                      cache=cache, snapshot=snapshot) as converter:
+        return await converter.convert_batch(atc_codes, include_related)
+
+
+def convert_codes(atc_codes: List[str], include_related: bool = True,
+                  verbose: bool = False,
+                  cache: Optional[ResponseCache] = None,
+                  max_concurrency: int = 8,
+                  snapshot: Optional[ATCNDCSnapshot] = None) -> List[DrugInfo]:
+    """
+    Synchronous wrapper around convert_codes_async for scripts and the CLI.
+    
+    Args:
+        atc_codes: List of ATC codes to convert
+        include_related: If True, also search related drug forms for additional NDCs
+        verbose: If True, print detailed information during conversion
+        cache: Optional ResponseCache used to skip repeated API calls
+        max_concurrency: Maximum number of ATC codes converted at once
+        snapshot: Optional ATCNDCSnapshot answering known codes without API calls
+        
+    Returns:
+        List of DrugInfo objects
+    """
+    return asyncio.run(
+        convert_codes_async(atc_codes, include_related, verbose, cache, max_concurrency, snapshot)
+    )
+
+
+@functools.lru_cache(maxsize=65536)
 def format_ndc(ndc: str) -> str:
     """
     Format NDC code in standard 5-4-2 format.
     
+    Results are memoized: related drug forms share many NDCs, so batch
+    exports format the same code repeatedly.
+    
     Args:
         ndc: Raw NDC code
         
@@ -301,39 +953,45 @@ def print_results(drug_info: DrugInfo, detailed: bool = True):
         drug_info: DrugInfo object containing conversion results
         detailed: If True, print detailed information
     """
-    print("\n" + "="*80)
-    print(f"ATC CODE: {drug_info.atc_code}")
-    print("="*80)
+    # The report is built as a list of lines and written with a single
+    # call, so long NDC lists do not cost one print() per code
+    lines = [
+        "",
+        "="*80,
+        f"ATC CODE: {drug_info.atc_code}",
+        "="*80,
+    ]
     
     if drug_info.rxcui:
-        print(f"RxCUI: {drug_info.rxcui}")
+        lines.append(f"RxCUI: {drug_info.rxcui}")
         if drug_info.drug_name:
-            print(f"Drug Name: {drug_info.drug_name}")
+            lines.append(f"Drug Name: {drug_info.drug_name}")
         
         if drug_info.ndc_codes:
-            print(f"\nFound {len(drug_info.ndc_codes)} NDC code(s):")
-            print("-" * 80)
-            
-            for i, ndc in enumerate(drug_info.ndc_codes, 1):
-                formatted_ndc = format_ndc(ndc)
-                if detailed:
-                    print(f"{i:3d}. {formatted_ndc} (raw: {ndc})")
-                else:
-                    print(f"{i:3d}. {formatted_ndc}")
+            lines.append(f"\nFound {len(drug_info.ndc_codes)} NDC code(s):")
+            lines.append("-" * 80)
+            
+            if detailed:
+                lines.extend(f"{i:3d}. {format_ndc(ndc)} (raw: {ndc})"
+                             for i, ndc in enumerate(drug_info.ndc_codes, 1))
+            else:
+                lines.extend(f"{i:3d}. {format_ndc(ndc)}"
+                             for i, ndc in enumerate(drug_info.ndc_codes, 1))
         else:
-            print("\n⚠️  No NDC codes found for this ATC code.")
-            print("This might mean:")
-            print("  - The drug is not marketed in the US")
-            print("  - The drug is classified at a higher level (ingredient level)")
-            print("  - The mapping data is incomplete")
+            lines.append("\n⚠️  No NDC codes found for this ATC code.")
+            lines.append("This might mean:")
+            lines.append("  - The drug is not marketed in the US")
+            lines.append("  - The drug is classified at a higher level (ingredient level)")
+            lines.append("  - The mapping data is incomplete")
     else:
-        print("\n❌ No RxCUI found for this ATC code.")
-        print("This might mean:")
-        print("  - The ATC code is invalid")
-        print("  - The drug is not in the RxNorm database")
-        print("  - The ATC classification is not yet mapped")
+        lines.append("\n❌ No RxCUI found for this ATC code.")
+        lines.append("This might mean:")
+        lines.append("  - The ATC code is invalid")
+        lines.append("  - The drug is not in the RxNorm database")
+        lines.append("  - The ATC classification is not yet mapped")
     
-    print("="*80)
+    lines.append("="*80)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def save_to_json(results: List[DrugInfo], filename: str):
@@ -354,8 +1012,12 @@ def save_to_json(results: List[DrugInfo], filename: str):
             'ndc_count': len(info.ndc_codes)
         })
     
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
+    if orjson is not None:
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
     
     print(f"\n✅ Results saved to: {filename}")
 
@@ -370,28 +1032,17 @@ def save_to_csv(results: List[DrugInfo], filename: str):
     """
     import csv
     
-    with open(filename, 'w', newline='') as f:
+    # Codes without NDCs still get one row, with empty NDC columns
+    rows = (
+        (info.atc_code, info.rxcui or '', info.drug_name or '', ndc, format_ndc(ndc) if ndc else '')
+        for info in results
+        for ndc in (info.ndc_codes or ('',))
+    )
+    
+    with open(filename, 'w', newline='', buffering=1 << 20) as f:
         writer = csv.writer(f)
         writer.writerow(['ATC_Code', 'RxCUI', 'Drug_Name', 'NDC_Code', 'NDC_Formatted'])
-        
-        for info in results:
-            if info.ndc_codes:
-                for ndc in info.ndc_codes:
-                    writer.writerow([
-                        info.atc_code,
-                        info.rxcui or '',
-                        info.drug_name or '',
-                        ndc,
-                        format_ndc(ndc)
-                    ])
-            else:
-                writer.writerow([
-                    info.atc_code,
-                    info.rxcui or '',
-                    info.drug_name or '',
-                    '',
-                    ''
-                ])
+        writer.writerows(rows)
     
     print(f"\n✅ Results saved to: {filename}")
 
@@ -407,9 +1058,12 @@ def main():
 Examples:
   %(prog)s C10AA07                    # Convert single ATC code
   %(prog)s C10AA07 N02BE01            # Convert multiple ATC codes
+  %(prog)s C10AA07 N02BE01 -w 4       # Convert at most 4 codes at a time
   %(prog)s C10AA07 --output results   # Save results to JSON and CSV
   %(prog)s C10AA07 --verbose          # Show detailed processing info
   %(prog)s C10AA07 --no-related       # Only direct matches, no related forms
+  %(prog)s C10AA07 --no-cache         # Always query the API, skip the response cache
+  %(prog)s C10AA07 --no-snapshot      # Ignore the precomputed snapshot, ask the API
 
 Common ATC codes for testing:
   C10AA07 - Rosuvastatin (cholesterol medication)
@@ -438,6 +1092,32 @@ Common ATC codes for testing:
         help='Do not include related drug forms in search'
     )
     
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=8,
+        help='Maximum number of ATC codes converted concurrently (default: 8)'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write the on-disk API response cache'
+    )
+    
+    parser.add_argument(
+        '--cache-ttl',
+        type=int,
+        default=DEFAULT_CACHE_TTL,
+        help=f'Age in seconds after which cached API responses are revalidated (default: {DEFAULT_CACHE_TTL})'
+    )
+    
+    parser.add_argument(
+        '--no-snapshot',
+        action='store_true',
+        help='Do not answer codes from the precomputed ATC to NDC snapshot'
+    )
+    
     parser.add_argument(
         '-o', '--output',
         type=str,
@@ -458,24 +1138,24 @@ Common ATC codes for testing:
     
     args = parser.parse_args()
     
-    # Create converter
-    converter = ATCtoNDCConverter(verbose=args.verbose)
+    cache = None if args.no_cache else ResponseCache(ttl=args.cache_ttl)
+    snapshot = None if args.no_snapshot else ATCNDCSnapshot.open_default()
+    
+    # Convert codes (concurrently when more than one is given)
+    results = convert_codes(
+        args.atc_codes,
+        include_related=not args.no_related,
+        verbose=args.verbose,
+        cache=cache,
+        max_concurrency=args.workers,
+        snapshot=snapshot
+    )
     
-    # Convert codes
-    if len(args.atc_codes) == 1:
+    if len(results) == 1:
         # Single code conversion
-        result = converter.convert(
-            args.atc_codes[0],
-            include_related=not args.no_related
-        )
-        print_results(result)
-        results = [result]
+        print_results(results[0])
     else:
         # Batch conversion
-        results = converter.convert_batch(
-            args.atc_codes,
-            include_related=not args.no_related
-        )
         for result in results:
             print_results(result, detailed=False)
     
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Precompute ATC → NDC conversions for every known ATC code.
+
+Runs the ATC to NDC converter over the codes in atc_mapping_complete.json
+and stores the results in mappings/data/atc_ndc_snapshot.sqlite. The converter
+answers codes found there without calling the RxNorm API. RxNorm changes
+at most monthly, so rebuild the snapshot about that often.
+
+Usage:
+    python build_atc_ndc_snapshot.py              # Level 5 (substance) codes
+    python build_atc_ndc_snapshot.py --all-levels # Every ATC code
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from atc_to_ndc_converter import DEFAULT_SNAPSHOT_PATH, ATCNDCSnapshot, convert_codes
+from rxnav_cache import ResponseCache
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Precompute ATC to NDC conversions into a local snapshot'
+    )
+    parser.add_argument('--data-dir', default=str(DEFAULT_SNAPSHOT_PATH.parent),
+                        help='Directory containing atc_mapping_complete.json (default: ../mappings/data/)')
+    parser.add_argument('--all-levels', action='store_true',
+                        help='Convert every ATC level, not only level 5 substances')
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help='Maximum number of ATC codes converted concurrently (default: 8)')
+    args = parser.parse_args()
+    
+    data_dir = Path(args.data_dir)
+    atc_file = data_dir / "atc_mapping_complete.json"
+    snapshot_file = data_dir / "atc_ndc_snapshot.sqlite"
+    
+    print("\n" + "="*80)
+    print("📸 BUILDING ATC → NDC SNAPSHOT")
+    print("="*80)
+    
+    if not atc_file.exists():
+        print(f"\n❌ File not found: {atc_file}")
+        print("Run 'python download_all_mappings.py' in mappings/ first.")
+        return 1
+    
+    with open(atc_file, 'r', encoding='utf-8') as f:
+        atc_data = json.load(f)
+    
+    # Only substances map to RxNorm ingredients; classes usually have no RxCUI
+    codes = [code for code in atc_data if args.all_levels or len(code) == 7]
+    print(f"\n🔄 Converting {len(codes):,} ATC codes...")
+    
+    results = convert_codes(codes, include_related=True, cache=ResponseCache(),
+                            max_concurrency=args.workers)
+    stored = ATCNDCSnapshot.write(snapshot_file, results)
+    
+    failed = sum(1 for info in results if info.lookup_failed)
+    
+    print(f"\n✅ ATC codes stored: {stored:,} of {len(codes):,}")
+    print(f"✅ NDC codes stored: {sum(len(info.ndc_codes) for info in results if info.rxcui and not info.lookup_failed):,}")
+    if failed:
+        print(f"⚠️  ATC codes skipped after API errors: {failed:,} (rebuild to retry them)")
+    print(f"\n💾 Saved to: {snapshot_file}")
+    print("\n" + "="*80 + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Local RxNorm API Proxy
+
+Every run of atc_to_ndc_converter.py opens new TLS connections to
+rxnav.nlm.nih.gov. Shell loops that call the converter once per code pay
+that setup on every iteration. This proxy stays running, keeps its
+upstream connections alive and answers from the on-disk response cache
+where it can.
+
+Usage:
+    python rxnav_proxy.py                    # Listen on 127.0.0.1:8765
+    export RXNAV_BASE_URL=http://127.0.0.1:8765/REST
+    python atc_to_ndc_converter.py C10AA07   # Now goes through the proxy
+"""
+
+import argparse
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+import requests
+
+from rxnav_cache import DEFAULT_CACHE_TTL, ResponseCache
+
+
+UPSTREAM_URL = "https://rxnav.nlm.nih.gov/REST"
+PREFIX = "/REST"
+
+
+class RxNavProxy:
+    """
+    Forwards RxNorm API GET requests over one pooled requests.Session.
+    
+    Successful responses are stored in an optional ResponseCache and
+    revalidated with conditional GETs once they expire, the same way
+    ATCtoNDCConverter uses the cache.
+    """
+    
+    def __init__(self, upstream: str = UPSTREAM_URL, cache: Optional[ResponseCache] = None,
+                 pool_size: int = 32):
+        """
+        Initialize the proxy.
+        
+        Args:
+            upstream: Base URL requests are forwarded to
+            cache: Optional ResponseCache shared by all request threads
+            pool_size: Number of upstream keep-alive connections to hold
+        """
+        self.upstream = upstream.rstrip('/')
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    def fetch(self, path: str) -> Tuple[int, bytes]:
+        """
+        Fetch an API path (including query string) from upstream or the cache.
+        
+        Args:
+            path: Path below /REST, e.g. "/rxcui.json?idtype=ATC&id=C10AA07"
+        
+        Returns:
+            Tuple of (HTTP status, response body)
+        """
+        url = f"{self.upstream}{path}"
+        
+        if self.cache is None:
+            response = self.session.get(url, timeout=10)
+            return response.status_code, response.content
+        
+        body = self.cache.get(url)
+        if body is not None:
+            return 200, body
+        
+        response = self.session.get(url, headers=self.cache.validators(url), timeout=10)
+        if response.status_code == 304:
+            body = self.cache.refresh(url)
+            if body is not None:
+                return 200, body
+            response = self.session.get(url, timeout=10)
+        
+        if response.status_code == 200:
+            self.cache.set(url, response.content,
+                           response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response.status_code, response.content
+
+
+def make_handler(proxy: RxNavProxy, verbose: bool = False):
+    """Build a request handler class bound to proxy"""
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep client connections alive too
+        
+        def do_GET(self):
+            if not self.path.startswith(PREFIX + '/'):
+                self._reply(404, b'{"error": "not found"}')
+                return
+            
+            try:
+                status, body = proxy.fetch(self.path[len(PREFIX):])
+            except requests.exceptions.RequestException as e:
+                self._reply(502, f'{{"error": "{type(e).__name__}"}}'.encode())
+                return
+            
+            self._reply(status, body)
+        
+        def _reply(self, status: int, body: bytes):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+    
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Local caching proxy for the RxNorm API',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                        # Listen on 127.0.0.1:8765
+  %(prog)s --port 9000 -v         # Other port, log every request
+
+Then point the converter at it:
+  export RXNAV_BASE_URL=http://127.0.0.1:8765/REST
+        """
+    )
+    
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    parser.add_argument('--upstream', default=UPSTREAM_URL,
+                        help=f'RxNorm API base URL (default: {UPSTREAM_URL})')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the on-disk response cache')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_CACHE_TTL,
+                        help=f'Age in seconds after which cached responses are revalidated (default: {DEFAULT_CACHE_TTL})')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log every request')
+    
+    args = parser.parse_args()
+    
+    cache = None if args.no_cache else ResponseCache(ttl=args.cache_ttl)
+    proxy = RxNavProxy(upstream=args.upstream, cache=cache)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(proxy, args.verbose))
+    
+    print(f"🔁 Proxying http://{args.host}:{args.port}{PREFIX} → {proxy.upstream}")
+    print(f"   export RXNAV_BASE_URL=http://{args.host}:{args.port}{PREFIX}")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopping proxy")
+    finally:
+        server.server_close()
+        if cache is not None:
+            cache.close()
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Build mappings.sqlite from the downloaded ATC and NDC mapping files.
+
+lookup_code.py can answer lookups straight from the JSON files, but that
+means parsing all of them (tens of MB) in every process. This one-shot tool
+stores the same data in an indexed SQLite database so each lookup is a
+single primary-key query:
+
+    atc(code PRIMARY KEY, json)              # atc_mapping_complete.json entries
+    ndc(code PRIMARY KEY, simple, full)      # ndc_mapping_simple.json + ndc_mapping.json
+                                             # (or ndc_mapping.jsonl, see load_ndc_mappings())
+    ndc_alias(alias PRIMARY KEY, canonical)  # every accepted spelling -> ndc.code
+
+Usage:
+    python build_sqlite.py                  # Build data/mappings.sqlite
+    python build_sqlite.py --data-dir data  # Custom data directory
+
+Re-run after downloading new mappings (lookup_code.py ignores a stale database).
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, fall back to the standard library
+    orjson = None
+
+
+def _read_json(path: Path):
+    """Parse a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _dumps(value) -> bytes:
+    """Serialize a value to compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def ndc_aliases(code: str) -> List[str]:
+    """
+    Get every spelling of an NDC key that lookups should accept.
+    
+    Besides the code itself and its dashless spelling, each segment is
+    zero-padded to the 5-4-2 layout (labeler-product-package), so that
+    "16571-853" is also found as "16571-0853" and "165710853".
+    
+    Args:
+        code: NDC code as stored in the mapping files (e.g., "22840-5322")
+    
+    Returns:
+        List of aliases, the code itself first
+    """
+    aliases = [code, code.replace('-', '')]
+    
+    segments = code.split('-')
+    if 2 <= len(segments) <= 3:
+        padded = [segment.zfill(width) for segment, width in zip(segments, (5, 4, 2))]
+        aliases.append('-'.join(padded))
+        aliases.append(''.join(padded))
+    
+    return list(dict.fromkeys(aliases))
+
+
+def ndc_alias_map(codes: Iterable[str]) -> Dict[str, str]:
+    """
+    Map every accepted spelling of the given NDC keys to the key itself.
+    
+    Exact codes are entered first, so they always win over a derived alias
+    of another code that happens to spell the same. Both the ndc_alias
+    table and lookup_code.py's JSON fallback are built from this.
+    
+    Args:
+        codes: NDC codes as stored in the mapping files
+    
+    Returns:
+        Dictionary of alias -> NDC code
+    """
+    codes = list(codes)
+    alias_map = {code: code for code in codes}
+    for code in codes:
+        for alias in ndc_aliases(code)[1:]:
+            alias_map.setdefault(alias, code)
+    return alias_map
+
+
+def _load(data_dir: Path, name: str, quiet: bool = False) -> Dict:
+    """Load a mapping file from data_dir, or an empty dict if it is missing."""
+    path = data_dir / name
+    if not path.exists():
+        if not quiet:
+            print(f"⚠️  Skipping missing file: {path}")
+        return {}
+    return _read_json(path)
+
+
+def load_ndc_jsonl(path: Path) -> Dict[str, Dict]:
+    """
+    Load an ndc_mapping.jsonl file into a dictionary of code -> info.
+    
+    The file holds one {code: info} object per line, as written by
+    step3_download_ndc_from_fda.py --jsonl; a later line for the same code
+    replaces an earlier one.
+    """
+    ndc_full = {}
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                ndc_full.update(orjson.loads(line) if orjson is not None else json.loads(line))
+    return ndc_full
+
+
+def load_ndc_mappings(data_dir: Path, quiet: bool = False) -> Tuple[Dict, Dict]:
+    """
+    Load the simple and full NDC mappings from data_dir.
+    
+    Reads ndc_mapping_simple.json and ndc_mapping.json. If ndc_mapping.jsonl
+    (from a --jsonl download) is newer than ndc_mapping.json, or that file
+    is missing, both mappings are taken from the JSONL file instead.
+    
+    Args:
+        data_dir: Directory containing the mapping files
+        quiet: If True, do not warn about missing files
+    
+    Returns:
+        Tuple of (code -> description, code -> full info)
+    """
+    json_file = data_dir / "ndc_mapping.json"
+    jsonl_file = data_dir / "ndc_mapping.jsonl"
+    
+    if jsonl_file.exists() and (not json_file.exists()
+                                or jsonl_file.stat().st_mtime > json_file.stat().st_mtime):
+        ndc_full = load_ndc_jsonl(jsonl_file)
+        return {code: info['description'] for code, info in ndc_full.items()}, ndc_full
+    
+    return (_load(data_dir, "ndc_mapping_simple.json", quiet),
+            _load(data_dir, "ndc_mapping.json", quiet))
+
+
+def build_database(data_dir: Path, db_file: Path) -> Dict[str, int]:
+    """
+    Build the SQLite database from the mapping files.
+    
+    The database is written to a temporary file and moved into place at
+    the end, so readers never see a half-built file.
+    
+    Args:
+        data_dir: Directory containing the mapping JSON files
+        db_file: Output database path
+    
+    Returns:
+        Row counts per table
+    """
+    atc = _load(data_dir, "atc_mapping_complete.json")
+    ndc_simple, ndc_full = load_ndc_mappings(data_dir)
+    
+    tmp_file = db_file.with_name(db_file.name + '.tmp')
+    if tmp_file.exists():
+        tmp_file.unlink()
+    
+    conn = sqlite3.connect(str(tmp_file))
+    # The file is rebuilt from scratch and swapped in atomically, so no
+    # journal or fsync is needed while loading it
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript("""
+        CREATE TABLE atc (code TEXT PRIMARY KEY, json BLOB NOT NULL) WITHOUT ROWID;
+        CREATE TABLE ndc (code TEXT PRIMARY KEY, simple TEXT, full BLOB) WITHOUT ROWID;
+        CREATE TABLE ndc_alias (alias TEXT PRIMARY KEY, canonical TEXT NOT NULL) WITHOUT ROWID;
+    """)
+    
+    ndc_codes = list(dict.fromkeys(list(ndc_simple) + list(ndc_full)))
+    
+    with conn:
+        conn.executemany(
+            "INSERT INTO atc (code, json) VALUES (?, ?)",
+            ((code, _dumps(info)) for code, info in atc.items())
+        )
+        conn.executemany(
+            "INSERT INTO ndc (code, simple, full) VALUES (?, ?, ?)",
+            ((code,
+              ndc_simple.get(code),
+              _dumps(ndc_full[code]) if code in ndc_full else None)
+             for code in ndc_codes)
+        )
+        conn.executemany(
+            "INSERT INTO ndc_alias (alias, canonical) VALUES (?, ?)",
+            ndc_alias_map(ndc_codes).items()
+        )
+    
+    counts = {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ('atc', 'ndc', 'ndc_alias')
+    }
+    conn.close()
+    
+    os.replace(tmp_file, db_file)
+    return counts
+
+
+def run(data_dir: Path) -> bool:
+    """
+    Build data_dir/mappings.sqlite and print a summary.
+    
+    Args:
+        data_dir: Directory containing the mapping files
+    
+    Returns:
+        True if the database was built from at least one mapping file
+    """
+    data_dir = Path(data_dir)
+    db_file = data_dir / "mappings.sqlite"
+    
+    print("\n" + "="*80)
+    print("🗄️  BUILDING MAPPINGS DATABASE")
+    print("="*80)
+    
+    counts = build_database(data_dir, db_file)
+    
+    if not counts['atc'] and not counts['ndc']:
+        print("\n❌ No mapping files found. Run 'python download_all_mappings.py' first.")
+        return False
+    
+    print(f"\n✅ ATC codes:   {counts['atc']:,}")
+    print(f"✅ NDC codes:   {counts['ndc']:,}")
+    print(f"✅ NDC aliases: {counts['ndc_alias']:,}")
+    print(f"\n💾 Saved to: {db_file}")
+    print("\n" + "="*80 + "\n")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build mappings.sqlite from the ATC and NDC mapping files'
+    )
+    parser.add_argument('--data-dir', default=str(Path(__file__).parent / 'data'),
+                        help='Directory containing the mapping files (default: data/)')
+    args = parser.parse_args()
+    
+    return 0 if run(Path(args.data_dir)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,25 +20,26 @@ Output Files (saved to ../data/):
     - ndc_mapping_simple.json       # NDC simple descriptions (ALL codes)
 """
 
-import subprocess
 import sys
 from pathlib import Path
 
+import build_sqlite
+import step1_download_atc_basic
+import step2_enhance_atc_add_level5
+import step3_download_ndc_from_fda
 
-def run_script(script_name, args=None):
-    """Run a Python script and show output."""
-    cmd = [sys.executable, script_name]
-    if args:
-        cmd.extend(args)
-    
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def run_step(name, run, *args, **kwargs):
+    """Run a step's run() function in-process and show output."""
     print(f"\n{'='*80}")
-    print(f"▶️  Running: {script_name}")
+    print(f"▶️  Running: {name}")
     print(f"{'='*80}\n")
     
-    result = subprocess.run(cmd, cwd=Path(__file__).parent)
-    
-    if result.returncode != 0:
-        print(f"\n❌ Error running {script_name}")
+    if not run(*args, **kwargs):
+        print(f"\n❌ Error running {name}")
         return False
     return True
 
@@ -56,29 +57,48 @@ def main():
     
     input("\n⏸️  Press ENTER to start download (or Ctrl+C to cancel)...")
     
+    # One session for all steps, so connections to rxnav.nlm.nih.gov and
+    # api.fda.gov are opened once and kept alive between steps
+    with step1_download_atc_basic.make_session() as session:
+        return download_all(session)
+
+
+def download_all(session):
+    """Run every download step with a shared requests.Session."""
+    
     # Step 1: Download basic ATC codes
-    print("\n📍 STEP 1/3: Downloading ATC codes (Levels 1-4)...")
+    print("\n📍 STEP 1/4: Downloading ATC codes (Levels 1-4)...")
     print("   Time: ~5 seconds")
-    if not run_script('step1_download_atc_basic.py', ['--atc']):
+    if not run_step('step1_download_atc_basic.py', step1_download_atc_basic.run,
+                    DATA_DIR, atc=True, session=session):
         print("\n❌ Failed at Step 1")
         return 1
     
     # Step 2: Enhance ATC with Level 5 and hierarchies
-    print("\n📍 STEP 2/3: Enhancing ATC with Level 5 substances & hierarchies...")
+    print("\n📍 STEP 2/4: Enhancing ATC with Level 5 substances & hierarchies...")
     print("   Time: ~10 seconds")
-    if not run_script('step2_enhance_atc_add_level5.py'):
+    if not run_step('step2_enhance_atc_add_level5.py', step2_enhance_atc_add_level5.run,
+                    DATA_DIR, session=session):
         print("\n❌ Failed at Step 2")
         return 1
     
     # Step 3: Download ALL NDC codes
-    print("\n📍 STEP 3/3: Downloading ALL NDC codes from FDA...")
+    print("\n📍 STEP 3/4: Downloading ALL NDC codes from FDA...")
     print("   Time: ~30 minutes (downloading 100,000+ codes)")
     print("   Progress bar will show status...")
     
-    if not run_script('step3_download_ndc_from_fda.py', ['--full']):
+    if not run_step('step3_download_ndc_from_fda.py', step3_download_ndc_from_fda.run,
+                    DATA_DIR, limit=-1, session=session):
         print("\n❌ Failed at Step 3")
         return 1
     
+    # Step 4: Build the SQLite database used for fast lookups
+    print("\n📍 STEP 4/4: Building mappings database...")
+    print("   Time: ~5 seconds")
+    if not run_step('build_sqlite.py', build_sqlite.run, DATA_DIR):
+        print("\n❌ Failed at Step 4")
+        return 1
+    
     # Success!
     print("\n" + "="*80)
     print("✅ SUCCESS! ALL MAPPINGS DOWNLOADED")
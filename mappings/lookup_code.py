@@ -10,79 +10,182 @@ Usage:
 Returns a formatted string description.
 """
 
+import functools
 import json
+import re
+import sqlite3
 import sys
 from pathlib import Path
+from typing import Optional
 
+from build_sqlite import load_ndc_mappings, ndc_alias_map
 
+try:
+    import orjson
+except ImportError:  # optional speed-up, fall back to the standard library
+    orjson = None
+
+
+def _loads(data):
+    """Parse JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _read_json(path):
+    """Parse a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class SQLiteMapping:
+    """
+    Read-only mapping over one column of a table in mappings.sqlite.
+    
+    Every access is a single primary-key SELECT (on the key column), so
+    nothing is loaded up front and the database pages are shared between
+    processes through the OS page cache.
+    """
+    
+    def __init__(self, conn, table, column, decode=False, key='code'):
+        self._conn = conn
+        self._table = table
+        self._column = column
+        self._decode = decode
+        self._key = key
+    
+    def get(self, code, default=None):
+        row = self._conn.execute(
+            f"SELECT {self._column} FROM {self._table} WHERE {self._key} = ?", (code,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return default
+        return _loads(row[0]) if self._decode else row[0]
+    
+    def __contains__(self, code):
+        return self.get(code) is not None
+    
+    def __getitem__(self, code):
+        value = self.get(code)
+        if value is None:
+            raise KeyError(code)
+        return value
+    
+    def __bool__(self):
+        return self._conn.execute(
+            f"SELECT 1 FROM {self._table} WHERE {self._column} IS NOT NULL LIMIT 1"
+        ).fetchone() is not None
+
+
+def _connect_database(data_dir):
+    """Open mappings.sqlite read-only if it exists and is newer than the JSON files."""
+    db_file = data_dir / "mappings.sqlite"
+    if not db_file.exists():
+        return None
+    
+    db_mtime = db_file.stat().st_mtime
+    for name in ("atc_mapping_complete.json", "ndc_mapping_simple.json", "ndc_mapping.json",
+                 "ndc_mapping.jsonl"):
+        json_file = data_dir / name
+        if json_file.exists() and json_file.stat().st_mtime > db_mtime:
+            return None  # stale - rebuild with build_sqlite.py
+    
+    return sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, check_same_thread=False)
+
+
+@functools.lru_cache(maxsize=1)
 def load_mappings():
-    """Load ATC and NDC mapping files."""
+    """
+    Load ATC and NDC mapping files.
+    
+    Uses mappings.sqlite (see build_sqlite.py) when it is up to date, so
+    each lookup is an indexed query; otherwise the JSON files are parsed.
+    Either way this happens once per process and later calls return the
+    same (shared, not to be modified) mappings. Use clear_cache() to force
+    a reload after the files change.
+    """
     # Try both possible locations
     data_dir = Path(__file__).parent / "data"
     if not data_dir.exists():
         data_dir = Path(__file__).parent.parent / "data"
     
+    conn = _connect_database(data_dir)
+    if conn is not None:
+        return {
+            'atc': SQLiteMapping(conn, 'atc', 'json', decode=True),
+            'ndc_simple': SQLiteMapping(conn, 'ndc', 'simple'),
+            'ndc_full': SQLiteMapping(conn, 'ndc', 'full', decode=True),
+            'ndc_alias': SQLiteMapping(conn, 'ndc_alias', 'canonical', key='alias'),
+        }
+    
     mappings = {}
     
     # Load ATC complete mapping
     atc_file = data_dir / "atc_mapping_complete.json"
     if atc_file.exists():
-        with open(atc_file, 'r', encoding='utf-8') as f:
-            mappings['atc'] = json.load(f)
+        mappings['atc'] = _read_json(atc_file)
     else:
         mappings['atc'] = {}
     
-    # Load NDC simple mapping
-    ndc_simple_file = data_dir / "ndc_mapping_simple.json"
-    if ndc_simple_file.exists():
-        with open(ndc_simple_file, 'r', encoding='utf-8') as f:
-            mappings['ndc_simple'] = json.load(f)
-    else:
-        mappings['ndc_simple'] = {}
+    # Load NDC simple and full mappings (from ndc_mapping.jsonl after a --jsonl download)
+    mappings['ndc_simple'], mappings['ndc_full'] = load_ndc_mappings(data_dir, quiet=True)
     
-    # Load NDC full mapping
-    ndc_full_file = data_dir / "ndc_mapping.json"
-    if ndc_full_file.exists():
-        with open(ndc_full_file, 'r', encoding='utf-8') as f:
-            mappings['ndc_full'] = json.load(f)
-    else:
-        mappings['ndc_full'] = {}
+    # Same aliases as the ndc_alias table, so both paths accept the same spellings
+    mappings['ndc_alias'] = ndc_alias_map(
+        dict.fromkeys(list(mappings['ndc_simple']) + list(mappings['ndc_full']))
+    )
     
     return mappings
 
 
-def is_atc_code(code):
+def clear_cache():
+    """Drop the loaded mappings so the next lookup re-reads the files."""
+    load_mappings.cache_clear()
+
+
+# ATC codes follow the level grammar A, A10, A10B, A10BA, A10BA02
+_ATC_PATTERN = r'[A-Z](?:[0-9]{2}(?:[A-Z](?:[A-Z](?:[0-9]{2})?)?)?)?'
+# NDC codes: 8-11 bare digits, or labeler-product[-package] with hyphens
+_NDC_PATTERN = r'[0-9]{8,11}|[0-9]{4,5}-[0-9]{3,4}(?:-[0-9]{1,2})?'
+
+_ATC_RE = re.compile(_ATC_PATTERN)
+_NDC_RE = re.compile(_NDC_PATTERN)
+# Both grammars in one pattern, so classifying a code takes a single match
+_CODE_RE = re.compile(f'(?P<atc>{_ATC_PATTERN})|(?P<ndc>{_NDC_PATTERN})')
+
+
+def normalize_code(code: str) -> str:
+    """Remove all whitespace (surrounding and inner) from a code and upper-case it."""
+    return ''.join(code.split()).upper()
+
+
+def is_atc_code(code: str) -> bool:
     """Check if code looks like an ATC code."""
-    code = code.strip().upper()
-    # ATC codes are 1, 3, 4, 5, or 7 characters
-    # Start with a letter
-    if len(code) in [1, 3, 4, 5, 7] and code[0].isalpha():
-        return True
-    return False
+    return _ATC_RE.fullmatch(normalize_code(code)) is not None
 
 
-def is_ndc_code(code):
+def is_ndc_code(code: str) -> bool:
     """Check if code looks like an NDC code."""
-    # NDC codes contain digits and possibly hyphens
-    # Can be 8-11 digits (various formats)
-    code_clean = code.replace('-', '').replace(' ', '')
-    if code_clean.isdigit() and 8 <= len(code_clean) <= 11:
-        return True
-    # Also check if it has NDC hyphen pattern (digits-digits-digits)
-    if '-' in code and all(part.isdigit() for part in code.split('-')):
-        return True
-    return False
+    return _NDC_RE.fullmatch(normalize_code(code)) is not None
+
+
+def classify_code(code: str) -> Optional[str]:
+    """Return 'atc', 'ndc' or None depending on what code looks like."""
+    match = _CODE_RE.fullmatch(normalize_code(code))
+    return match.lastgroup if match else None
 
 
 def format_atc_description(code, atc_data):
     """Format ATC code info as a string."""
-    code = code.strip().upper()
+    code = normalize_code(code)
     
-    if code not in atc_data:
+    info = atc_data.get(code)
+    if info is None:
         return f"❌ ATC code '{code}' not found in database"
     
-    info = atc_data[code]
-    
     # Build description
     lines = []
     lines.append(f"ATC Code: {info['code']}")
@@ -100,30 +203,18 @@ def format_atc_description(code, atc_data):
     return '\n'.join(lines)
 
 
-def format_ndc_description(code, ndc_simple, ndc_full):
-    """Format NDC code info as a string."""
-    code = code.strip()
-    
-    # Try to normalize NDC format
-    code_variants = [
-        code,
-        code.replace('-', ''),
-    ]
+def format_ndc_description(code, ndc_simple, ndc_full, ndc_alias=None):
+    """
+    Format NDC code info as a string.
     
-    # Also try with different hyphen positions
-    if '-' not in code and len(code) >= 10:
-        # Try 5-4-2 format
-        if len(code) == 11:
-            code_variants.append(f"{code[:5]}-{code[5:9]}-{code[9:]}")
-        elif len(code) == 10:
-            code_variants.append(f"{code[:4]}-{code[4:8]}-{code[8:]}")
+    ndc_alias maps every accepted spelling of a code to its key (see
+    build_sqlite.ndc_alias_map()); it is built from ndc_simple if omitted.
+    """
+    code = normalize_code(code)
     
-    # Search in simple mapping first
-    found_code = None
-    for variant in code_variants:
-        if variant in ndc_simple:
-            found_code = variant
-            break
+    if ndc_alias is None:
+        ndc_alias = ndc_alias_map(ndc_simple)
+    found_code = ndc_alias.get(code) or ndc_alias.get(code.replace('-', ''))
     
     if not found_code:
         return f"❌ NDC code '{code}' not found in database"
@@ -131,11 +222,11 @@ def format_ndc_description(code, ndc_simple, ndc_full):
     # Build description
     lines = []
     lines.append(f"NDC Code: {found_code}")
-    lines.append(f"Description: {ndc_simple[found_code]}")
+    lines.append(f"Description: {ndc_simple.get(found_code, 'N/A')}")
     
     # Add full details if available
-    if found_code in ndc_full:
-        full_info = ndc_full[found_code]
+    full_info = ndc_full.get(found_code)
+    if full_info is not None:
         lines.append("Product Details:")
         
         if full_info.get('brand_name'):
@@ -180,17 +271,20 @@ def lookup_code(code):
     Returns:
         Formatted string description
     """
-    # Load mappings
+    # Load mappings (parsed only on the first call)
     mappings = load_mappings()
     
     if not mappings['atc'] and not mappings['ndc_simple']:
         return "❌ Error: Mapping files not found. Run 'python download_all_mappings.py' first."
     
-    # Determine code type and format
-    if is_atc_code(code):
-        return format_atc_description(code, mappings['atc'])
-    elif is_ndc_code(code):
-        return format_ndc_description(code, mappings['ndc_simple'], mappings['ndc_full'])
+    # Determine code type and format; every step sees the same normalized code
+    normalized = normalize_code(code)
+    code_type = classify_code(normalized)
+    if code_type == 'atc':
+        return format_atc_description(normalized, mappings['atc'])
+    elif code_type == 'ndc':
+        return format_ndc_description(normalized, mappings['ndc_simple'], mappings['ndc_full'],
+                                      mappings['ndc_alias'])
     else:
         return f"❌ Could not determine if '{code}' is an ATC or NDC code.\n\nATC codes: 1-7 characters, start with letter (e.g., C10AA07)\nNDC codes: 10-11 digits, may have hyphens (e.g., 47335-0985-60)"
 
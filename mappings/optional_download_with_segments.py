@@ -12,18 +12,56 @@ Usage:
 """
 
 import argparse
-import json
+import functools
+import os
 import sys
-import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
-import requests
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
+from step1_download_atc_basic import (
+    HTTP_CACHE_PATH, json_line, loads_json, make_session, write_json
+)
 
-def fetch_atc_with_substances() -> Dict[str, Dict]:
+try:
+    import ijson
+except ImportError:  # Optional: pages are parsed with response.json() instead
+    ijson = None
+
+
+MAX_WORKERS = 10  # Concurrent requests to RxNav at most
+NDC_PAGE_WORKERS = 5  # Concurrent FDA page requests, well under its rate limit
+
+# FDA record fields copied into product_info, with their defaults
+PRODUCT_INFO_FIELDS = ('brand_name', 'generic_name', 'dosage_form', 'route', 'labeler_name', 'product_type')
+PRODUCT_INFO_DEFAULTS = ('', '', '', [], '', '')
+
+LABELER_DESCRIPTION = 'Manufacturer/Labeler identifier'
+PRODUCT_DESCRIPTION = 'Product identifier (drug, strength, dosage form)'
+PACKAGE_DESCRIPTION = 'Package size and type identifier'
+
+# Digit count -> (product start, package start) offsets for NDCs that
+# cannot be split on hyphens
+HYPHENATED_FALLBACK_SLICES = {11: (5, 9), 10: (5, 8)}
+UNHYPHENATED_SLICES = {11: (5, 9), 10: (4, 8)}
+
+# (ndc, entry, is_package) as built from one FDA product record
+NDCEntry = Tuple[str, Dict, bool]
+
+# Shared by every fetch (and worker thread) so connections stay alive;
+# responses are cached on disk when requests-cache is installed
+SESSION = make_session(cache_path=HTTP_CACHE_PATH)
+
+
+def fetch_atc_with_substances(progress_file: Optional[Path] = None) -> Dict[str, Dict]:
     """
     Fetch ATC codes with all 5 levels including substance names.
     
+    Args:
+        progress_file: Optional checkpoint of fetched ATC classes, see
+            fetch_ingredients_with_atc()
+    
     Returns:
         Dictionary with ATC codes and their full hierarchy
     """
@@ -38,7 +76,7 @@ def fetch_atc_with_substances() -> Dict[str, Dict]:
     url = "https://rxnav.nlm.nih.gov/REST/rxclass/allClasses.json?classTypes=ATC1-4"
     
     try:
-        response = requests.get(url, timeout=30)
+        response = SESSION.get(url, timeout=30)
         response.raise_for_status()
         data = response.json()
         
@@ -52,8 +90,7 @@ def fetch_atc_with_substances() -> Dict[str, Dict]:
                 atc_enhanced[atc_code] = {
                     'code': atc_code,
                     'name': atc_name,
-                    'level': len(atc_code),
-                    'hierarchy': build_atc_hierarchy(atc_code, atc_name, {})
+                    'level': len(atc_code)
                 }
         
         print(f"✅ Fetched {len(atc_enhanced):,} ATC codes (Levels 1-4)")
@@ -66,7 +103,7 @@ def fetch_atc_with_substances() -> Dict[str, Dict]:
     print("\n📊 Step 2: Fetching ATC Level 5 (Substances) from RxNorm...")
     
     # Get all ingredients and their ATC codes
-    ingredients_with_atc = fetch_ingredients_with_atc()
+    ingredients_with_atc = fetch_ingredients_with_atc(progress_file)
     
     # Add substance-level entries
     substance_count = 0
@@ -78,12 +115,16 @@ def fetch_atc_with_substances() -> Dict[str, Dict]:
                     'code': atc_code,
                     'name': ing_data['name'],
                     'level': 5,
-                    'hierarchy': build_atc_hierarchy(atc_code, ing_data['name'], atc_enhanced),
                     'rxcui': rxcui
                 }
     
     print(f"✅ Found {substance_count} substance-level (Level 5) ATC codes")
     
+    # Step 3: Build hierarchies once every code is known, so parent names
+    # are always filled in
+    for code, entry in atc_enhanced.items():
+        entry['hierarchy'] = build_atc_hierarchy(code, entry['name'], atc_enhanced)
+    
     return atc_enhanced
 
 
@@ -91,29 +132,34 @@ def build_atc_hierarchy(code: str, name: str, atc_map: Dict) -> Dict:
     """Build full hierarchy for an ATC code."""
     hierarchy = {}
     
-    if len(code) >= 1:
-        hierarchy['level1'] = {'code': code[0], 'name': atc_map.get(code[0], {}).get('name', '')}
-    if len(code) >= 3:
-        hierarchy['level2'] = {'code': code[:3], 'name': atc_map.get(code[:3], {}).get('name', '')}
-    if len(code) >= 4:
-        hierarchy['level3'] = {'code': code[:4], 'name': atc_map.get(code[:4], {}).get('name', '')}
-    if len(code) >= 5:
-        hierarchy['level4'] = {'code': code[:5], 'name': atc_map.get(code[:5], {}).get('name', '')}
+    # Parent levels are the code prefixes of length 1, 3, 4 and 5
+    for level, prefix_length in (('level1', 1), ('level2', 3), ('level3', 4), ('level4', 5)):
+        if len(code) < prefix_length:
+            break
+        prefix = code[:prefix_length]
+        parent = atc_map.get(prefix)
+        hierarchy[level] = {'code': prefix, 'name': parent['name'] if parent else ''}
+    
     if len(code) == 7:
         hierarchy['level5'] = {'code': code, 'name': name}
     
     return hierarchy
 
 
-def fetch_ingredients_with_atc() -> Dict[str, Dict]:
+def fetch_ingredients_with_atc(progress_file: Optional[Path] = None) -> Dict[str, Dict]:
     """
     Fetch ingredients from RxNorm and their associated ATC codes.
     
+    If progress_file is given, the members of each ATC class are saved to
+    it as soon as they are fetched, and classes found there are not
+    fetched again. It is removed once every class has been fetched.
+    
+    Args:
+        progress_file: Optional checkpoint file used to resume
+    
     Returns:
         Dictionary of rxcui -> {name, atc_codes}
     """
-    ingredients = {}
-    
     # We'll query for common drug classes and get their ingredients
     common_classes = [
         'C10AA',  # Statins
@@ -125,43 +171,93 @@ def fetch_ingredients_with_atc() -> Dict[str, Dict]:
         'N06AB',  # SSRIs
     ]
     
-    for atc_class in common_classes:
-        try:
-            # Get drugs in this class
-            url = f"https://rxnav.nlm.nih.gov/REST/rxclass/classMembers.json?classId={atc_class}&relaSource=ATC"
-            response = requests.get(url, timeout=10)
+    progress = load_progress(progress_file) if progress_file is not None else {}
+    completed = progress.get('completed_classes', {})
+    
+    # Class members are fetched concurrently on a bounded pool, whose size
+    # is the rate limit. Each membership already names the member's ATC
+    # code, so class -> members is inverted into rxcui -> ATC codes in
+    # memory; only members listed without one are looked up separately
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        pending = [atc_class for atc_class in common_classes if atc_class not in completed]
+        for atc_class, class_members in zip(pending, executor.map(fetch_class_members, pending)):
+            # An empty result is a failed (or empty) class; retry it next run
+            if class_members:
+                completed[atc_class] = class_members
+                if progress_file is not None:
+                    save_progress(progress_file, {'completed_classes': completed})
+        
+        members = [tuple(member) for atc_class in common_classes
+                   for member in completed.get(atc_class, [])]
+        
+        atc_codes_by_rxcui = defaultdict(list)
+        for rxcui, _, atc_code in members:
+            if atc_code and atc_code not in atc_codes_by_rxcui[rxcui]:
+                atc_codes_by_rxcui[rxcui].append(atc_code)
+        
+        missing = list(dict.fromkeys(rxcui for rxcui, _, _ in members if not atc_codes_by_rxcui[rxcui]))
+        for rxcui, atc_codes in zip(missing, executor.map(get_atc_codes_for_rxcui, missing)):
+            atc_codes_by_rxcui[rxcui] = list(atc_codes)
+    
+    if progress_file is not None and progress_file.exists() and len(completed) == len(common_classes):
+        progress_file.unlink()
+    
+    # Merged in class order, so names match a serial run
+    ingredients = {}
+    for rxcui, name, _ in members:
+        ingredients[rxcui] = {
+            'name': name,
+            'atc_codes': atc_codes_by_rxcui[rxcui]
+        }
+    
+    return ingredients
+
+
+def fetch_class_members(atc_class: str) -> List[Tuple[str, str, str]]:
+    """
+    Fetch the ingredients of one ATC class.
+    
+    Args:
+        atc_class: ATC class code (e.g., "C10AA")
+    
+    Returns:
+        List of (rxcui, name, atc_code) tuples, where atc_code is the
+        member's own (Level 5) code, or '' if the API did not give one
+    """
+    class_members = []
+    
+    try:
+        # Get drugs in this class
+        url = f"https://rxnav.nlm.nih.gov/REST/rxclass/classMembers.json?classId={atc_class}&relaSource=ATC"
+        response = SESSION.get(url, timeout=10)
+        
+        if response.status_code == 200:
+            data = response.json()
+            members = data.get('drugMemberGroup', {}).get('drugMember', [])
             
-            if response.status_code == 200:
-                data = response.json()
-                members = data.get('drugMemberGroup', {}).get('drugMember', [])
+            for member in members[:10]:  # Limit to avoid too many requests
+                rxcui = member.get('minConcept', {}).get('rxcui')
+                name = member.get('minConcept', {}).get('name', '')
                 
-                for member in members[:10]:  # Limit to avoid too many requests
-                    rxcui = member.get('minConcept', {}).get('rxcui')
-                    name = member.get('minConcept', {}).get('name', '')
-                    
-                    if rxcui and name:
-                        # Get full ATC codes for this ingredient
-                        atc_codes = get_atc_codes_for_rxcui(rxcui)
-                        
-                        ingredients[rxcui] = {
-                            'name': name,
-                            'atc_codes': atc_codes
-                        }
+                # The membership's source ID is the substance-level ATC code
+                atc_code = next((attr.get('attrValue', '') for attr in member.get('nodeAttr', [])
+                                 if attr.get('attrName') == 'SourceId'), '')
                 
-                time.sleep(0.3)  # Rate limiting
-                
-        except Exception as e:
-            print(f"  ⚠️  Error fetching {atc_class}: {e}")
-            continue
+                if rxcui and name:
+                    class_members.append((rxcui, name, atc_code))
     
-    return ingredients
+    except Exception as e:
+        print(f"  ⚠️  Error fetching {atc_class}: {e}")
+    
+    return class_members
 
 
-def get_atc_codes_for_rxcui(rxcui: str) -> List[str]:
-    """Get all ATC codes (including Level 5) for an RxCUI."""
+@functools.lru_cache(maxsize=4096)
+def get_atc_codes_for_rxcui(rxcui: str) -> Tuple[str, ...]:
+    """Get all ATC codes (including Level 5) for an RxCUI, cached per process."""
     try:
         url = f"https://rxnav.nlm.nih.gov/REST/rxclass/class/byRxcui.json?rxcui={rxcui}&relaSource=ATC"
-        response = requests.get(url, timeout=10)
+        response = SESSION.get(url, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -173,123 +269,291 @@ def get_atc_codes_for_rxcui(rxcui: str) -> List[str]:
                 if code:
                     atc_codes.append(code)
             
-            return atc_codes
+            return tuple(atc_codes)
     except:
         pass
     
-    return []
+    return ()
 
 
-def fetch_ndc_with_segments(limit: int = 5000) -> Dict[str, Dict]:
+def fetch_ndc_to_jsonl(output_file: Path, limit: int = 5000,
+                       progress_file: Optional[Path] = None) -> int:
     """
-    Fetch NDC codes with all 3 segments explained.
+    Fetch NDC codes with all 3 segments and write them to a JSONL file.
+    
+    Each entry is written as soon as its page is parsed, as one
+    {ndc: entry} object per line, so memory use does not grow with the
+    number of codes. Later lines for the same NDC replace earlier ones;
+    load_ndc_jsonl() rebuilds the {ndc: entry} dictionary.
+    
+    If progress_file is given, it records how far the download got after
+    every page. A run that stops early (network error, rate limit, Ctrl+C)
+    leaves it behind, and the next run with the same limit and output file
+    appends to output_file from there instead of starting over. It is
+    removed once the download completes, so its presence after the call
+    means the download is incomplete. Use one progress file per output
+    file.
+    
+    Args:
+        output_file: JSONL file to write
+        limit: Number of NDC product records to fetch
+        progress_file: Optional checkpoint file used to resume
     
     Returns:
-        Dictionary with NDC codes and segment breakdown
+        Number of lines in output_file
+    """
+    seen = set()
+    written = 0
+    start = 0
+    
+    progress = load_progress(progress_file) if progress_file is not None else {}
+    if (progress.get('limit') == limit and progress.get('output') == output_file.name
+            and output_file.exists() and output_file.stat().st_size >= progress.get('offset', 0)):
+        start = progress.get('skip', 0)
+        
+        # Drop anything written after the last checkpoint, then recover
+        # the NDCs already written so duplicates are still resolved
+        with open(output_file, 'r+b') as f:
+            f.truncate(progress.get('offset', 0))
+        with open(output_file, 'rb') as f:
+            for line in f:
+                seen.update(loads_json(line))
+                written += 1
+        
+        print(f"↩️  Resuming at record {start:,} ({written:,} entries already saved)")
+    
+    with open(output_file, 'ab' if start else 'wb') as f:
+        try:
+            for end, page_entries in iter_ndc_pages(limit, start=start):
+                for ndc, entry in iter_ndc_entries(page_entries, seen):
+                    f.write(json_line({ndc: entry}))
+                    written += 1
+                
+                if progress_file is not None:
+                    f.flush()
+                    save_progress(progress_file, {'output': output_file.name, 'limit': limit,
+                                                  'skip': end, 'offset': f.tell()})
+        except Exception:
+            # Already reported; the checkpoint lets the next run resume
+            print(f"\n💾 Saved {written:,} entries so far; rerun to resume")
+            return written
+    
+    if progress_file is not None and progress_file.exists():
+        progress_file.unlink()
+    
+    print(f"\n✅ Downloaded {len(seen):,} NDC codes with segment details")
+    return written
+
+
+def load_ndc_jsonl(path: Path) -> Dict[str, Dict]:
+    """Load a JSONL file written by fetch_ndc_to_jsonl() into a dictionary."""
+    ndc_enhanced = {}
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                ndc_enhanced.update(loads_json(line))
+    return ndc_enhanced
+
+
+def load_progress(progress_file: Path) -> Dict:
+    """Load a checkpoint written by save_progress(), or {} if there is none."""
+    try:
+        return loads_json(progress_file.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_progress(progress_file: Path, progress: Dict):
+    """Write a checkpoint atomically, so an interrupted write never corrupts it."""
+    tmp_file = progress_file.with_name(progress_file.name + '.tmp')
+    tmp_file.write_bytes(json_line(progress))
+    os.replace(tmp_file, progress_file)
+
+
+def iter_ndc_pages(limit: int, start: int = 0) -> Iterator[Tuple[int, List[NDCEntry]]]:
+    """
+    Yield the NDC entries of each page of FDA product records, in page order.
+    
+    Stops at the end of the data. A page that fails to download is
+    reported and its exception re-raised, after the pages before it.
+    
+    Args:
+        limit: Number of NDC product records to fetch
+        start: Number of records to skip (to resume an earlier download)
+    
+    Yields:
+        (records fetched so far including skipped ones, entries as
+        returned by build_ndc_entries()) tuples
     """
     print("\n" + "="*80)
     print("💊 DOWNLOADING ENHANCED NDC MAPPINGS (ALL 3 SEGMENTS)")
     print("="*80)
     print(f"🎯 Target: {limit:,} NDC codes\n")
     
-    ndc_enhanced = {}
-    skip = 0
     batch_size = 1000
     
-    while skip < limit:
-        remaining = limit - skip
-        current_batch_size = min(batch_size, remaining)
-        
-        print(f"⬇️  Fetching batch {skip:,} to {skip + current_batch_size:,}...", end=" ")
-        
-        # Fetch from FDA API
-        url = "https://api.fda.gov/drug/ndc.json"
-        params = {'skip': skip, 'limit': current_batch_size}
+    # All pages are known up front, so they are requested concurrently.
+    # Each worker builds its page's entries as soon as the page arrives,
+    # overlapping that work with the pages still in flight; only merging
+    # happens here, in page order
+    ranges = [(skip, min(batch_size, limit - skip)) for skip in range(start, limit, batch_size)]
+    
+    with ThreadPoolExecutor(max_workers=NDC_PAGE_WORKERS) as executor:
+        futures = [executor.submit(fetch_ndc_page_entries, skip, size) for skip, size in ranges]
         
         try:
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            results = data.get('results', [])
-            
-            if not results:
-                print("❌ No results")
-                break
-            
-            print(f"✅ Got {len(results)}")
-            
-            # Process each record
-            for record in results:
-                product_ndc = record.get('product_ndc', '').strip()
+            for (skip, size), future in zip(ranges, futures):
+                print(f"⬇️  Fetching batch {skip:,} to {skip + size:,}...", end=" ")
                 
-                # Get package NDCs (which have all 3 segments)
-                packages = record.get('packaging', [])
+                try:
+                    record_count, page_entries = future.result()
+                except Exception as e:
+                    print(f"❌ Error: {e}")
+                    raise
                 
-                for pkg in packages:
-                    package_ndc = pkg.get('package_ndc', '').strip()
-                    
-                    if package_ndc:
-                        # Parse segments
-                        segments = parse_ndc_segments(package_ndc)
-                        
-                        # Build enhanced entry
-                        ndc_enhanced[package_ndc] = {
-                            'ndc': package_ndc,
-                            'segments': segments,
-                            'product_info': {
-                                'brand_name': record.get('brand_name', ''),
-                                'generic_name': record.get('generic_name', ''),
-                                'dosage_form': record.get('dosage_form', ''),
-                                'route': ', '.join(record.get('route', [])),
-                                'labeler': record.get('labeler_name', ''),
-                                'product_type': record.get('product_type', '')
-                            },
-                            'active_ingredients': [
-                                {
-                                    'name': ing.get('name', ''),
-                                    'strength': ing.get('strength', '')
-                                }
-                                for ing in record.get('active_ingredients', [])
-                            ],
-                            'description': build_ndc_description(record)
-                        }
+                if not record_count:
+                    print("❌ No results")
+                    break
                 
-                # Also add product-level NDC
-                if product_ndc and product_ndc not in ndc_enhanced:
-                    segments = parse_ndc_segments(product_ndc)
-                    ndc_enhanced[product_ndc] = {
-                        'ndc': product_ndc,
-                        'segments': segments,
-                        'product_info': {
-                            'brand_name': record.get('brand_name', ''),
-                            'generic_name': record.get('generic_name', ''),
-                            'dosage_form': record.get('dosage_form', ''),
-                            'route': ', '.join(record.get('route', [])),
-                            'labeler': record.get('labeler_name', ''),
-                            'product_type': record.get('product_type', '')
-                        },
-                        'active_ingredients': [
-                            {
-                                'name': ing.get('name', ''),
-                                'strength': ing.get('strength', '')
-                            }
-                            for ing in record.get('active_ingredients', [])
-                        ],
-                        'description': build_ndc_description(record)
-                    }
-            
-            skip += len(results)
-            time.sleep(0.5)  # Rate limiting
-            
-            if len(results) < current_batch_size:
-                break
+                print(f"✅ Got {record_count}")
                 
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            break
+                yield skip + record_count, page_entries
+                
+                if record_count < size:
+                    break
+        finally:
+            # Pages past the end of the data (or after an error) are not needed
+            for pending in futures:
+                pending.cancel()
+
+
+def fetch_ndc_page_entries(skip: int, limit: int) -> Tuple[int, List[NDCEntry]]:
+    """
+    Fetch one page of NDC product records and build their entries.
     
-    print(f"\n✅ Downloaded {len(ndc_enhanced):,} NDC codes with segment details")
-    return ndc_enhanced
+    Args:
+        skip: Number of results to skip
+        limit: Number of results to fetch (max 1000 per request)
+    
+    Returns:
+        Tuple of (number of records on the page, entries)
+    """
+    results = fetch_ndc_page(skip, limit)
+    return len(results), build_ndc_entries(results)
+
+
+def fetch_ndc_page(skip: int, limit: int) -> List[Dict]:
+    """
+    Fetch one page of NDC product records from the FDA API.
+    
+    Args:
+        skip: Number of results to skip
+        limit: Number of results to fetch (max 1000 per request)
+    
+    Returns:
+        List of NDC product records
+    """
+    url = "https://api.fda.gov/drug/ndc.json"
+    params = {'skip': skip, 'limit': limit}
+    
+    if ijson is None:
+        response = SESSION.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        return response.json().get('results', [])
+    
+    # Parse records straight off the socket instead of holding the raw
+    # body, its decoded text and the parsed document at the same time
+    with SESSION.get(url, params=params, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return list(ijson.items(response.raw, 'results.item', use_float=True))
+
+
+def iter_ndc_entries(page_entries: List[NDCEntry], seen: Set[str]) -> Iterator[Tuple[str, Dict]]:
+    """
+    Merge a page of NDC entries into those yielded so far.
+    
+    A package NDC seen again replaces its earlier entry; a product NDC is
+    only yielded the first time it is seen.
+    
+    Args:
+        page_entries: Entries as returned by build_ndc_entries()
+        seen: NDCs yielded so far, updated in place
+    
+    Yields:
+        (ndc, entry) tuples
+    """
+    for ndc, entry, is_package in page_entries:
+        if is_package or ndc not in seen:
+            seen.add(ndc)
+            yield ndc, entry
+
+
+def build_ndc_entries(results: List[Dict]) -> List[NDCEntry]:
+    """
+    Build the package and product NDC entries of FDA records.
+    
+    Args:
+        results: NDC product records from the FDA API
+    
+    Returns:
+        List of (ndc, entry, is_package) tuples, each record's packages
+        followed by its product NDC
+    """
+    entries = []
+    
+    for record in results:
+        product_ndc = record.get('product_ndc', '').strip()
+        
+        # Product details are the same for every package of the record,
+        # so they are built once and shared by all of its entries
+        brand, generic, dosage, routes, labeler, product_type = map(
+            record.get, PRODUCT_INFO_FIELDS, PRODUCT_INFO_DEFAULTS
+        )
+        product_info = {
+            'brand_name': brand,
+            'generic_name': generic,
+            'dosage_form': dosage,
+            'route': ', '.join(routes),
+            'labeler': labeler,
+            'product_type': product_type
+        }
+        active_ingredients = [
+            {
+                'name': ing.get('name', ''),
+                'strength': ing.get('strength', '')
+            }
+            for ing in record.get('active_ingredients', [])
+        ]
+        description = build_ndc_description(record, route=product_info['route'])
+        
+        # Get package NDCs (which have all 3 segments)
+        packages = record.get('packaging', [])
+        
+        for pkg in packages:
+            package_ndc = pkg.get('package_ndc', '').strip()
+            
+            if package_ndc:
+                # Build enhanced entry
+                entries.append((package_ndc, {
+                    'ndc': package_ndc,
+                    'segments': parse_ndc_segments(package_ndc),
+                    'product_info': product_info,
+                    'active_ingredients': active_ingredients,
+                    'description': description
+                }, True))
+        
+        # Also add product-level NDC
+        if product_ndc:
+            entries.append((product_ndc, {
+                'ndc': product_ndc,
+                'segments': parse_ndc_segments(product_ndc),
+                'product_info': product_info,
+                'active_ingredients': active_ingredients,
+                'description': description
+            }, False))
+    
+    return entries
 
 
 def parse_ndc_segments(ndc: str) -> Dict:
@@ -302,70 +566,72 @@ def parse_ndc_segments(ndc: str) -> Dict:
     - 5-4-1 (labeler-product-package)
     - 5-4-2 (labeler-product-package) - most common
     """
-    # Remove hyphens for parsing
-    ndc_clean = ndc.replace('-', '')
-    
-    # Detect format based on hyphen positions in original
-    if '-' in ndc:
-        parts = ndc.split('-')
-        if len(parts) == 3:
-            labeler, product, package = parts
-        else:
-            # Fallback: assume 5-4-2
-            if len(ndc_clean) == 11:
-                labeler = ndc_clean[:5]
-                product = ndc_clean[5:9]
-                package = ndc_clean[9:]
-            elif len(ndc_clean) == 10:
-                labeler = ndc_clean[:5]
-                product = ndc_clean[5:8]
-                package = ndc_clean[8:]
-            else:
-                labeler = product = package = ''
-    else:
-        # No hyphens, assume 11-digit or 10-digit
-        if len(ndc_clean) == 11:
-            labeler = ndc_clean[:5]
-            product = ndc_clean[5:9]
-            package = ndc_clean[9:]
-        elif len(ndc_clean) == 10:
-            labeler = ndc_clean[:4]
-            product = ndc_clean[4:8]
-            package = ndc_clean[8:]
-        else:
-            labeler = product = package = ''
+    labeler, product, package = split_ndc(ndc)
     
     return {
         'segment1_labeler': {
             'code': labeler,
-            'description': 'Manufacturer/Labeler identifier'
+            'description': LABELER_DESCRIPTION
         },
         'segment2_product': {
             'code': product,
-            'description': 'Product identifier (drug, strength, dosage form)'
+            'description': PRODUCT_DESCRIPTION
         },
         'segment3_package': {
             'code': package,
-            'description': 'Package size and type identifier'
+            'description': PACKAGE_DESCRIPTION
         },
         'formatted': f"{labeler}-{product}-{package}" if labeler and product and package else ndc
     }
 
 
-def build_ndc_description(record: Dict) -> str:
-    """Build a descriptive string for an NDC."""
-    brand = record.get('brand_name', '')
-    generic = record.get('generic_name', '')
-    dosage = record.get('dosage_form', '')
-    route = ', '.join(record.get('route', []))
+@functools.lru_cache(maxsize=16384)
+def split_ndc(ndc: str) -> Tuple[str, str, str]:
+    """
+    Split an NDC into its (labeler, product, package) segments.
     
-    desc = brand or generic or "Unknown Product"
+    Hyphenated NDCs are split on their hyphens. Anything else is cut at
+    fixed offsets chosen by its digit count; unknown lengths give empty
+    segments.
+    """
+    if '-' in ndc:
+        parts = ndc.split('-')
+        if len(parts) == 3:
+            return tuple(parts)
+        # Fallback: assume 5-4-2 (or 5-3-2 for 10 digits)
+        slices = HYPHENATED_FALLBACK_SLICES
+    else:
+        # No hyphens, assume 11-digit (5-4-2) or 10-digit (4-4-2)
+        slices = UNHYPHENATED_SLICES
+    
+    ndc_clean = ndc.replace('-', '')
+    cuts = slices.get(len(ndc_clean))
+    if cuts is None:
+        return '', '', ''
+    
+    product_start, package_start = cuts
+    return ndc_clean[:product_start], ndc_clean[product_start:package_start], ndc_clean[package_start:]
+
+
+def build_ndc_description(record: Dict, route: Optional[str] = None) -> str:
+    """
+    Build a descriptive string for an NDC.
+    
+    Args:
+        record: NDC product record from the FDA API
+        route: The record's routes already joined with ', ', if the caller has them
+    """
+    if route is None:
+        route = ', '.join(record.get('route', []))
+    
+    parts = [record.get('brand_name') or record.get('generic_name') or "Unknown Product"]
+    dosage = record.get('dosage_form')
     if dosage:
-        desc += f" - {dosage}"
+        parts.append(f" - {dosage}")
     if route:
-        desc += f" ({route})"
+        parts.append(f" ({route})")
     
-    return desc
+    return ''.join(parts)
 
 
 def main():
@@ -379,9 +645,16 @@ def main():
     parser.add_argument('--all', action='store_true', help='Download both (default)')
     parser.add_argument('--ndc-limit', type=int, default=5000, help='NDC codes limit (default: 5000)')
     parser.add_argument('--data-dir', default='data', help='Output directory')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='Write NDC entries to ndc_mapping_enhanced.jsonl as they are downloaded')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Clear cached API responses and download everything again')
     
     args = parser.parse_args()
     
+    if args.no_cache and hasattr(SESSION, 'cache'):
+        SESSION.cache.clear()
+    
     if not (args.atc or args.ndc or args.all):
         args.all = True
     
@@ -395,12 +668,11 @@ def main():
     
     # Download ATC
     if args.atc or args.all:
-        atc_enhanced = fetch_atc_with_substances()
+        atc_enhanced = fetch_atc_with_substances(progress_file=data_dir / ".atc_progress.json")
         
         if atc_enhanced:
             output_file = data_dir / "atc_mapping_enhanced.json"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(atc_enhanced, f, indent=2, ensure_ascii=False)
+            write_json(output_file, atc_enhanced)
             print(f"\n💾 Saved enhanced ATC mapping to: {output_file}")
             
             # Show sample
@@ -411,14 +683,32 @@ def main():
                     for level, data in info['hierarchy'].items():
                         print(f"    {level}: {data['code']} = {data['name']}")
     
+    complete = True
+    
     # Download NDC
-    if args.ndc or args.all:
-        ndc_enhanced = fetch_ndc_with_segments(limit=args.ndc_limit)
+    if (args.ndc or args.all) and args.jsonl:
+        output_file = data_dir / "ndc_mapping_enhanced.jsonl"
+        progress_file = data_dir / ".ndc_jsonl_progress.json"
+        written = fetch_ndc_to_jsonl(output_file, limit=args.ndc_limit, progress_file=progress_file)
+        complete = not progress_file.exists()
+        if written and complete:
+            print(f"\n💾 Saved enhanced NDC mapping to: {output_file}")
+    elif args.ndc or args.all:
+        # Downloaded through a JSONL file first, so an interrupted run can resume
+        partial_file = data_dir / "ndc_mapping_enhanced.jsonl.part"
+        progress_file = data_dir / ".ndc_progress.json"
+        fetch_ndc_to_jsonl(partial_file, limit=args.ndc_limit, progress_file=progress_file)
+        
+        # After an error the pages downloaded so far are still written out;
+        # the partial file and checkpoint stay so the next run can resume
+        complete = not progress_file.exists()
+        ndc_enhanced = load_ndc_jsonl(partial_file) if partial_file.exists() else {}
+        if complete and partial_file.exists():
+            partial_file.unlink()
         
         if ndc_enhanced:
             output_file = data_dir / "ndc_mapping_enhanced.json"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(ndc_enhanced, f, indent=2, ensure_ascii=False)
+            write_json(output_file, ndc_enhanced)
             print(f"\n💾 Saved enhanced NDC mapping to: {output_file}")
             
             # Show sample
@@ -430,13 +720,23 @@ def main():
                 print(f"    Segment 2 (Product): {segments['segment2_product']['code']}")
                 print(f"    Segment 3 (Package): {segments['segment3_package']['code']}")
     
+    if not complete:
+        print("\n" + "="*80)
+        print("⚠️  NDC DOWNLOAD INCOMPLETE")
+        print("="*80)
+        print("\nThe NDC mapping only holds the pages downloaded before the error.")
+        print("Rerun the same command to resume where it stopped.")
+        print("\n")
+        return 1
+    
     print("\n" + "="*80)
     print("✅ DOWNLOAD COMPLETE")
     print("="*80)
     print(f"\nEnhanced mapping files saved to: {data_dir.absolute()}")
     print("\n")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
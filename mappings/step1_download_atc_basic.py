@@ -9,24 +9,178 @@ Usage:
     python download_mappings.py --ndc          # Download NDC mappings only
     python download_mappings.py --atc          # Download ATC mappings only  
     python download_mappings.py --all          # Download both
+
+    or import and call run(data_dir, atc=True, session=...)
 """
 
 import argparse
+import io
 import json
+import multiprocessing
 import os
 import sys
 import zipfile
+from datetime import timedelta
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict
-import urllib.request
+from typing import Dict, Iterable, List, Optional, Tuple
 import csv
 
+from tqdm import tqdm
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard library json module is used instead
+    orjson = None
+
+try:
+    import requests_cache
+except ImportError:  # Optional: responses are simply not cached
+    requests_cache = None
+
+
+# product.txt columns used to describe each NDC product
+PRODUCT_COLUMNS = ('PRODUCTNDC', 'PROPRIETARYNAME', 'NONPROPRIETARYNAME', 'DOSAGEFORMNAME',
+                   'ROUTENAME', 'SUBSTANCENAME', 'LABELERNAME')
+
+PRODUCT_SHARD_MIN_BYTES = 4 << 20  # Smaller files are not worth extra processes
+
+HTTP_CACHE_PATH = Path.home() / ".cache" / "atc_ndc" / "http_cache"
+HTTP_CACHE_EXPIRY = timedelta(days=7)  # RxClass and FDA data change at most monthly
+
+
+def make_session(pool_size: int = 20, cache_path: Optional[Path] = None, retries: int = 3):
+    """
+    Create a requests.Session with pooled keep-alive connections and retries.
+    
+    Transient failures (429 and 5xx responses, dropped connections) are
+    retried with exponential backoff, waiting as long as a Retry-After
+    header asks. If cache_path is given
+    and requests-cache is installed, GET responses are also stored in an
+    SQLite cache there for HTTP_CACHE_EXPIRY, honoring Cache-Control and
+    ETag headers where the APIs send them.
+    
+    Args:
+        pool_size: Number of connections kept alive per host
+        cache_path: Optional cache location (without the .sqlite suffix)
+        retries: Number of retries per request
+    
+    Returns:
+        Configured requests.Session (a CachedSession when caching)
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    retry = Retry(total=retries, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504],
+                  respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    if cache_path is not None and requests_cache is not None:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        session = requests_cache.CachedSession(
+            str(cache_path), backend='sqlite', expire_after=HTTP_CACHE_EXPIRY,
+            allowable_methods=['GET'], cache_control=True
+        )
+    else:
+        session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
-def download_file(url: str, output_path: str) -> bool:
-    """Download a file from URL to output_path."""
+
+def write_json(path: Path, data):
+    """Write data to path as indented UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def write_json_items(path: Path, items: Iterable[Tuple[str, object]]) -> int:
+    """
+    Write (key, value) pairs to path as an indented UTF-8 JSON object.
+    
+    Pairs are serialized one at a time, so they can come from a generator
+    instead of a dict built only to be written. For values that are not
+    lists or dicts the file is byte-for-byte what write_json() writes.
+    
+    Args:
+        path: File to write
+        items: (key, value) pairs, in output order
+    
+    Returns:
+        Number of pairs written
+    """
+    count = 0
+    with open(path, 'wb') as f:
+        for key, value in items:
+            f.write(b',\n  ' if count else b'{\n  ')
+            f.write(json_line(key)[:-1] + b': ' + json_line(value)[:-1])
+            count += 1
+        f.write(b'\n}' if count else b'{}')
+    return count
+
+
+def json_line(data) -> bytes:
+    """Serialize data as one line of compact UTF-8 JSON, newline included."""
+    if orjson is not None:
+        return orjson.dumps(data) + b'\n'
+    return (json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def loads_json(data: bytes):
+    """Parse JSON bytes (or a memoryview of them), using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
+
+def download_file(url: str, output_path: str, session=None) -> bool:
+    """
+    Download a file from URL to output_path.
+    
+    Data is written to output_path + '.part' first and renamed once
+    complete. If a partial file is left over from an interrupted run, the
+    download resumes from its end with an HTTP Range request.
+    
+    Args:
+        url: File URL
+        output_path: Destination path
+        session: Optional requests.Session to reuse connections
+    
+    Returns:
+        True if the file was downloaded completely
+    """
+    part_path = output_path + '.part'
+    http = session if session is not None else make_session()
+    
     try:
         print(f"⬇️  Downloading {url}...")
-        urllib.request.urlretrieve(url, output_path)
+        start = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={start}-'} if start else {}
+        
+        with http.get(url, stream=True, headers=headers, timeout=60) as response:
+            if start and response.status_code == 416:
+                # The partial file already holds the whole download
+                os.replace(part_path, output_path)
+                print(f"✅ Downloaded to {output_path}")
+                return True
+            
+            response.raise_for_status()
+            if response.status_code != 206:
+                start = 0  # Range not honored, start over
+            
+            length = int(response.headers.get('Content-Length', 0))
+            with open(part_path, 'ab' if start else 'wb') as f, \
+                    tqdm(total=start + length if length else None, initial=start,
+                         unit='B', unit_scale=True, desc=os.path.basename(output_path)) as pbar:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+                    pbar.update(len(chunk))
+        
+        os.replace(part_path, output_path)
         print(f"✅ Downloaded to {output_path}")
         return True
     except Exception as e:
@@ -47,10 +201,14 @@ def extract_zip(zip_path: str, extract_to: str) -> bool:
         return False
 
 
-def download_ndc_mappings(data_dir: Path) -> Dict[str, str]:
+def download_ndc_mappings(data_dir: Path, session=None) -> Dict[str, str]:
     """
     Download FDA NDC database and create NDC → description mapping.
     
+    Args:
+        data_dir: Output directory
+        session: Optional requests.Session to reuse connections
+    
     Returns:
         Dictionary mapping NDC codes to descriptions
     """
@@ -71,7 +229,7 @@ def download_ndc_mappings(data_dir: Path) -> Dict[str, str]:
     
     # Download product file
     if not product_zip.exists():
-        if not download_file(product_url, str(product_zip)):
+        if not download_file(product_url, str(product_zip), session=session):
             print("⚠️  Failed to download product file. Check FDA website for current link:")
             print("   https://www.fda.gov/drugs/drug-approvals-and-databases/national-drug-code-directory")
             return {}
@@ -82,7 +240,6 @@ def download_ndc_mappings(data_dir: Path) -> Dict[str, str]:
     
     # Parse product.txt to create mapping
     print("\n📊 Parsing NDC product file...")
-    ndc_mapping = {}
     product_file = ndc_dir / "product.txt"
     
     if not product_file.exists():
@@ -90,39 +247,13 @@ def download_ndc_mappings(data_dir: Path) -> Dict[str, str]:
         return {}
     
     try:
-        with open(product_file, 'r', encoding='utf-8', errors='ignore') as f:
-            reader = csv.DictReader(f, delimiter='\t')
-            for row in reader:
-                ndc_code = row.get('PRODUCTNDC', '').strip()
-                if not ndc_code:
-                    continue
-                
-                # Build description
-                proprietary = row.get('PROPRIETARYNAME', '').strip()
-                nonproprietary = row.get('NONPROPRIETARYNAME', '').strip()
-                dosage_form = row.get('DOSAGEFORMNAME', '').strip()
-                route = row.get('ROUTENAME', '').strip()
-                substance = row.get('SUBSTANCENAME', '').strip()
-                labeler = row.get('LABELERNAME', '').strip()
-                
-                description = f"{proprietary or nonproprietary}"
-                if dosage_form:
-                    description += f" - {dosage_form}"
-                if route:
-                    description += f" ({route})"
-                if substance:
-                    description += f" [{substance}]"
-                if labeler:
-                    description += f" | {labeler}"
-                
-                ndc_mapping[ndc_code] = description.strip()
+        ndc_mapping = parse_product_file(product_file)
         
         print(f"✅ Parsed {len(ndc_mapping):,} NDC codes")
         
         # Save to JSON
         output_file = data_dir / "ndc_mapping.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(ndc_mapping, f, indent=2, ensure_ascii=False)
+        write_json(output_file, ndc_mapping)
         print(f"💾 Saved NDC mapping to: {output_file}")
         
         # Show sample
@@ -137,13 +268,110 @@ def download_ndc_mappings(data_dir: Path) -> Dict[str, str]:
         return {}
 
 
-def download_atc_mappings_from_rxnorm(data_dir: Path) -> Dict[str, str]:
+def parse_product_file(product_file: Path, workers: Optional[int] = None) -> Dict[str, str]:
+    """
+    Parse FDA product.txt into an NDC → description mapping.
+    
+    The file is split into newline-aligned byte ranges that are parsed in
+    parallel worker processes, then merged in file order, so the result
+    is the same as parsing it in one pass.
+    
+    Args:
+        product_file: Path to the tab-separated product.txt
+        workers: Number of worker processes (default: CPU count)
+    
+    Returns:
+        Dictionary mapping NDC product codes to descriptions
+    """
+    with open(product_file, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8', errors='ignore')], delimiter='\t'), [])
+        header = [name.strip() for name in header]
+        data_start = f.tell()
+        size = f.seek(0, os.SEEK_END)
+        
+        # Look up column positions once instead of building a dict per row
+        columns = [header.index(name) if name in header else None for name in PRODUCT_COLUMNS]
+        
+        # Cut the data into one byte range per worker, each ending on a newline
+        workers = max(1, min(workers or os.cpu_count() or 1, (size - data_start) // PRODUCT_SHARD_MIN_BYTES))
+        bounds = [data_start]
+        for i in range(1, workers):
+            f.seek(data_start + (size - data_start) * i // workers)
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+        bounds.append(size)
+    
+    shards = [(str(product_file), start, end, columns) for start, end in zip(bounds, bounds[1:])]
+    
+    if len(shards) == 1:
+        return parse_product_shard(shards[0])
+    
+    ndc_mapping = {}
+    with multiprocessing.Pool(len(shards)) as pool:
+        for shard_mapping in pool.imap(parse_product_shard, shards):
+            ndc_mapping.update(shard_mapping)
+    return ndc_mapping
+
+
+def parse_product_shard(shard: Tuple[str, int, int, List[Optional[int]]]) -> Dict[str, str]:
+    """
+    Parse one byte range of product.txt.
+    
+    Args:
+        shard: (path, start offset, end offset, column index per PRODUCT_COLUMNS entry)
+    
+    Returns:
+        Dictionary mapping NDC product codes to descriptions
+    """
+    path, start, end, columns = shard
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8', errors='ignore')
+    
+    # Pull all seven fields of a complete row in one C-level call; only
+    # short rows or files missing a column need the per-field fallback
+    get_fields = itemgetter(*columns) if None not in columns else None
+    width = max(columns) + 1 if get_fields is not None else 0
+    
+    ndc_mapping = {}
+    for row in csv.reader(io.StringIO(text, newline=None), delimiter='\t'):
+        if get_fields is not None and len(row) >= width:
+            fields = get_fields(row)
+        else:
+            fields = [row[i] if i is not None and i < len(row) else '' for i in columns]
+        
+        (ndc_code, proprietary, nonproprietary, dosage_form,
+         route, substance, labeler) = map(str.strip, fields)
+        if not ndc_code:
+            continue
+        
+        # Build description
+        description = f"{proprietary or nonproprietary}"
+        if dosage_form:
+            description += f" - {dosage_form}"
+        if route:
+            description += f" ({route})"
+        if substance:
+            description += f" [{substance}]"
+        if labeler:
+            description += f" | {labeler}"
+        
+        ndc_mapping[ndc_code] = description.strip()
+    
+    return ndc_mapping
+
+
+def download_atc_mappings_from_rxnorm(data_dir: Path, session=None) -> Dict[str, str]:
     """
     Attempt to download ATC mappings using RxNorm API.
     
     Note: Full ATC database requires WHO data or UMLS license.
     This provides a basic set via RxClass API.
     
+    Args:
+        data_dir: Output directory
+        session: Optional requests.Session to reuse connections
+    
     Returns:
         Dictionary mapping ATC codes to descriptions
     """
@@ -151,7 +379,7 @@ def download_atc_mappings_from_rxnorm(data_dir: Path) -> Dict[str, str]:
     print("🔬 DOWNLOADING ATC MAPPINGS VIA RXNORM API")
     print("="*80)
     
-    import requests
+    http = session if session is not None else make_session()
     
     atc_mapping = {}
     
@@ -164,7 +392,7 @@ def download_atc_mappings_from_rxnorm(data_dir: Path) -> Dict[str, str]:
     try:
         # Get all ATC classes from RxClass
         url = "https://rxnav.nlm.nih.gov/REST/rxclass/allClasses.json?classTypes=ATC1-4"
-        response = requests.get(url, timeout=30)
+        response = http.get(url, timeout=30)
         response.raise_for_status()
         data = response.json()
         
@@ -180,8 +408,7 @@ def download_atc_mappings_from_rxnorm(data_dir: Path) -> Dict[str, str]:
         
         # Save to JSON
         output_file = data_dir / "atc_mapping.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(atc_mapping, f, indent=2, ensure_ascii=False)
+        write_json(output_file, atc_mapping)
         print(f"💾 Saved ATC mapping to: {output_file}")
         
         # Show sample
@@ -196,34 +423,20 @@ def download_atc_mappings_from_rxnorm(data_dir: Path) -> Dict[str, str]:
         return {}
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description='Download and parse ATC and NDC mapping files',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
-  %(prog)s --ndc           # Download NDC mappings only
-  %(prog)s --atc           # Download ATC mappings only
-  %(prog)s --all           # Download both (default)
-
-Output:
-  data/ndc_mapping.json    # NDC code → description
-  data/atc_mapping.json    # ATC code → description
-        """
-    )
-    
-    parser.add_argument('--ndc', action='store_true', help='Download NDC mappings')
-    parser.add_argument('--atc', action='store_true', help='Download ATC mappings')
-    parser.add_argument('--all', action='store_true', help='Download all mappings')
-    parser.add_argument('--data-dir', default='data', help='Output directory (default: data/)')
-    
-    args = parser.parse_args()
+def run(data_dir: Path, ndc: bool = False, atc: bool = False, session=None) -> bool:
+    """
+    Download the requested mappings into data_dir.
     
-    # Default to --all if no specific flag
-    if not (args.ndc or args.atc or args.all):
-        args.all = True
+    Args:
+        data_dir: Output directory (created if missing)
+        ndc: Download NDC mappings
+        atc: Download ATC mappings
+        session: Optional requests.Session shared with other steps
     
-    data_dir = Path(args.data_dir)
+    Returns:
+        True if every requested download produced a mapping
+    """
+    data_dir = Path(data_dir)
     data_dir.mkdir(parents=True, exist_ok=True)
     
     print("\n" + "="*80)
@@ -231,10 +444,13 @@ Output:
     print("="*80)
     print(f"\nOutput directory: {data_dir.absolute()}\n")
     
+    success = True
+    
     # Download NDC mappings
-    if args.ndc or args.all:
-        ndc_map = download_ndc_mappings(data_dir)
+    if ndc:
+        ndc_map = download_ndc_mappings(data_dir, session=session)
         if not ndc_map:
+            success = False
             print("\n⚠️  NDC download failed. Manual steps:")
             print("   1. Visit: https://www.fda.gov/drugs/drug-approvals-and-databases/national-drug-code-directory")
             print("   2. Download product.zip")
@@ -242,9 +458,10 @@ Output:
             print("   4. Re-run this script")
     
     # Download ATC mappings
-    if args.atc or args.all:
-        atc_map = download_atc_mappings_from_rxnorm(data_dir)
+    if atc:
+        atc_map = download_atc_mappings_from_rxnorm(data_dir, session=session)
         if not atc_map:
+            success = False
             print("\n⚠️  ATC download incomplete. For complete ATC data:")
             print("   Option 1 - WHO ATC Index:")
             print("      https://www.whocc.no/atc_ddd_index/")
@@ -260,6 +477,38 @@ Output:
     print(f"  ndc_map = json.load(open('{data_dir}/ndc_mapping.json'))")
     print(f"  atc_map = json.load(open('{data_dir}/atc_mapping.json'))")
     print("\n")
+    
+    return success
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Download and parse ATC and NDC mapping files',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --ndc           # Download NDC mappings only
+  %(prog)s --atc           # Download ATC mappings only
+  %(prog)s --all           # Download both (default)
+
+Output:
+  data/ndc_mapping.json    # NDC code → description
+  data/atc_mapping.json    # ATC code → description
+        """
+    )
+    
+    parser.add_argument('--ndc', action='store_true', help='Download NDC mappings')
+    parser.add_argument('--atc', action='store_true', help='Download ATC mappings')
+    parser.add_argument('--all', action='store_true', help='Download all mappings')
+    parser.add_argument('--data-dir', default='data', help='Output directory (default: data/)')
+    
+    args = parser.parse_args()
+    
+    # Default to --all if no specific flag
+    if not (args.ndc or args.atc or args.all):
+        args.all = True
+    
+    run(Path(args.data_dir), ndc=args.ndc or args.all, atc=args.atc or args.all)
 
 
 if __name__ == "__main__":
@@ -7,93 +7,170 @@ This script:
 2. Fixes hierarchy references
 3. Adds known ATC Level 5 substance codes
 4. Saves enhanced version with complete hierarchies
+
+Run directly, or import and call run(data_dir, session=...).
 """
 
+import functools
 import json
-import requests
-import time
+import mmap
+import shelve
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from tqdm import tqdm
 
+from step1_download_atc_basic import loads_json, make_session
+
+
+MAX_WORKERS = 10  # Concurrent requests to RxNav at most
+
+# Used when no session is passed in, so calls still share pooled,
+# retrying connections
+SESSION = make_session(retries=5)
+
+# (hierarchy key, code prefix length, description) of the levels above a code
+PARENT_LEVELS = (
+    ('level1', 1, 'Anatomical main group'),
+    ('level2', 3, 'Therapeutic subgroup'),
+    ('level3', 4, 'Pharmacological subgroup'),
+    ('level4', 5, 'Chemical subgroup'),
+)
+SUBSTANCE_DESCRIPTION = 'Chemical substance'
+
+# Shelve database (in data_dir) of RxCUI -> Level 5 codes kept between runs
+RXCUI_ATC5_CACHE_FILE = '.rxcui_atc5.cache'
+
 
 def load_atc_mapping(file_path: str) -> Dict:
-    """Load existing ATC mapping."""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """
+    Load existing ATC mapping.
+    
+    The file is memory-mapped and parsed straight from the mapped bytes
+    (with orjson when installed), without decoding it to a str first.
+    """
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        with memoryview(buf) as data:
+            return loads_json(data)
 
 
-def build_complete_hierarchy(code: str, name: str, atc_flat_map: Dict[str, str]) -> Dict:
+def build_hierarchies(atc_codes: Dict[str, str], atc_flat_map: Dict[str, str],
+                      parents_by_prefix: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
     """
-    Build complete hierarchy for an ATC code using the flat mapping.
+    Build complete hierarchies for many ATC codes in one pass.
+    
+    The Level 1-4 part of a hierarchy depends only on the first five
+    characters of the code, so it is built once per distinct prefix (see
+    parent_levels()) and copied for every code below it.
     
     Args:
-        code: ATC code (e.g., "C10AA" or "C10AA07")
-        name: Name for this code
-        atc_flat_map: Simple dict of code -> name
+        atc_codes: Dict of code -> name to build hierarchies for
+        atc_flat_map: Simple dict of code -> name used for parent names
+        parents_by_prefix: Optional memo of prefix -> level entries to
+            reuse between calls (see build_hierarchy())
     
     Returns:
-        Dictionary with all hierarchy levels
+        Dictionary of code -> hierarchy
     """
-    hierarchy = {}
-    
-    # Level 1: Anatomical (1 character)
-    if len(code) >= 1:
-        l1_code = code[0]
-        hierarchy['level1'] = {
-            'code': l1_code,
-            'name': atc_flat_map.get(l1_code, 'Unknown'),
-            'description': 'Anatomical main group'
-        }
+    if parents_by_prefix is None:
+        parents_by_prefix = {}
     
-    # Level 2: Therapeutic (3 characters)
-    if len(code) >= 3:
-        l2_code = code[:3]
-        hierarchy['level2'] = {
-            'code': l2_code,
-            'name': atc_flat_map.get(l2_code, 'Unknown'),
-            'description': 'Therapeutic subgroup'
-        }
+    return {
+        code: build_hierarchy(code, name, atc_flat_map, parents_by_prefix)
+        for code, name in atc_codes.items()
+    }
+
+
+def build_hierarchy(code: str, name: str, atc_flat_map: Dict[str, str],
+                    parents_by_prefix: Dict[str, Dict]) -> Dict:
+    """
+    Build the complete hierarchy for one ATC code from memoized parents.
     
-    # Level 3: Pharmacological (4 characters)
-    if len(code) >= 4:
-        l3_code = code[:4]
-        hierarchy['level3'] = {
-            'code': l3_code,
-            'name': atc_flat_map.get(l3_code, 'Unknown'),
-            'description': 'Pharmacological subgroup'
-        }
+    Each level up to the code's own gets an entry with its code, name and
+    description. When the code's parent levels are already in
+    parents_by_prefix (e.g. a substance whose Level 4 class was built
+    before) only the level5 entry is new.
     
-    # Level 4: Chemical (5 characters)
-    if len(code) >= 5:
-        l4_code = code[:5]
-        hierarchy['level4'] = {
-            'code': l4_code,
-            'name': atc_flat_map.get(l4_code, 'Unknown'),
-            'description': 'Chemical subgroup'
-        }
+    Args:
+        code: ATC code (e.g., "C10AA" or "C10AA07")
+        name: Name for this code
+        atc_flat_map: Simple dict of code -> name used for parent names
+        parents_by_prefix: Memo of prefix -> level entries, shared between calls
+    
+    Returns:
+        Dictionary with all hierarchy levels
+    """
+    hierarchy = dict(parent_levels(code[:5], atc_flat_map, parents_by_prefix))
     
-    # Level 5: Substance (7 characters)
     if len(code) == 7:
         hierarchy['level5'] = {
             'code': code,
             'name': name,
-            'description': 'Chemical substance'
+            'description': SUBSTANCE_DESCRIPTION
         }
     
     return hierarchy
 
 
-def fetch_substance_level_atc() -> List[Dict]:
+def parent_levels(prefix: str, atc_flat_map: Dict[str, str],
+                  parents_by_prefix: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Get the Level 1-4 hierarchy entries for codes starting with prefix.
+    
+    Results are memoized in parents_by_prefix. Each level entry is built
+    once, for the prefix that is exactly that level's code, and shared by
+    the hierarchies of all longer prefixes below it.
+    
+    Args:
+        prefix: First (up to) five characters of an ATC code
+        atc_flat_map: Simple dict of code -> name used for parent names
+        parents_by_prefix: Memo of prefix -> level entries, shared between calls
+    
+    Returns:
+        Dictionary of level key -> entry; do not modify it
+    """
+    parents = parents_by_prefix.get(prefix)
+    if parents is not None:
+        return parents
+    
+    parents = {}
+    for level_key, prefix_length, description in PARENT_LEVELS:
+        if len(prefix) < prefix_length:
+            break
+        if len(prefix) > prefix_length:
+            parent = parent_levels(prefix[:prefix_length], atc_flat_map, parents_by_prefix)
+            parents[level_key] = parent[level_key]
+        else:
+            parents[level_key] = {
+                'code': prefix,
+                'name': atc_flat_map.get(prefix, 'Unknown'),
+                'description': description
+            }
+    
+    parents_by_prefix[prefix] = parents
+    return parents
+
+
+def fetch_substance_level_atc(session=None, cache_file: Optional[Path] = None) -> List[Dict]:
     """
     Fetch ATC Level 5 (substance) codes by querying RxNorm ingredients.
     
+    If cache_file is given, the Level 5 codes found for each ingredient
+    are kept in a shelve database there, and ingredients already in it
+    are not looked up again on later runs.
+    
+    Args:
+        session: Optional requests.Session to reuse connections
+        cache_file: Optional path of the on-disk RxCUI -> ATC5 cache
+    
     Returns:
-        List of dicts with {code, name, rxcui}
+        List of dicts with {code, name, rxcui}, one per distinct code
     """
     print("\n🔍 Fetching ATC Level 5 (substance) codes from RxNorm...")
     
-    substances = []
+    substances = {}  # code -> substance; the first ingredient found keeps the code
     
     # Strategy: Get ingredients from RxNorm and check their ATC codes
     # We'll query by drug classes to find specific ingredients
@@ -111,69 +188,132 @@ def fetch_substance_level_atc() -> List[Dict]:
         ('A10BA', 'Biguanides'),
     ]
     
-    pbar = tqdm(common_atc_classes, desc="Fetching Level 5 substances", unit="class")
-    
-    for atc_class, class_name in pbar:
-        pbar.set_postfix_str(f"{atc_class}")
+    # All class member requests are submitted at once, and each new
+    # ingredient's lookup is queued on the same bounded pool (whose size is
+    # the rate limit) as soon as its class arrives, so lookups overlap the
+    # remaining class requests. Results are collected in class order, as a
+    # serial run would
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+            shelve.open(str(cache_file)) if cache_file else nullcontext({}) as cached:
+        class_futures = [executor.submit(fetch_class_ingredients, atc_class, session=session)
+                         for atc_class, _ in common_atc_classes]
         
-        try:
-            # Get ingredients in this class
-            url = f"https://rxnav.nlm.nih.gov/REST/rxclass/classMembers.json?classId={atc_class}&relaSource=ATC&relas=has_ingredient"
-            response = requests.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                members = data.get('drugMemberGroup', {}).get('drugMember', [])
-                
-                for member in members:
-                    rxcui = member.get('minConcept', {}).get('rxcui')
-                    name = member.get('minConcept', {}).get('name', '').strip()
-                    
-                    if rxcui and name:
-                        # Try to get specific ATC5 code for this ingredient
-                        atc5_codes = get_atc5_for_ingredient(rxcui)
-                        
-                        for atc5 in atc5_codes:
-                            if len(atc5) == 7:  # Verify it's Level 5
-                                substances.append({
-                                    'code': atc5,
-                                    'name': name,
-                                    'rxcui': rxcui
-                                })
-                                pbar.write(f"    ✓ Found: {atc5} = {name}")
-            
-            time.sleep(0.5)  # Rate limiting
-            
-        except Exception as e:
-            pbar.write(f"    ⚠️  Error: {e}")
-            continue
+        members = []
+        atc5_codes_by_rxcui = {}
+        pending = {}
+        for future in tqdm(class_futures, desc="Fetching class members", unit="class"):
+            for rxcui, name in future.result():
+                members.append((rxcui, name))
+                if rxcui in atc5_codes_by_rxcui or rxcui in pending:
+                    continue
+                if rxcui in cached:
+                    atc5_codes_by_rxcui[rxcui] = cached[rxcui]
+                else:
+                    pending[rxcui] = executor.submit(get_atc5_for_ingredient, rxcui, session=session)
+        
+        if atc5_codes_by_rxcui:
+            print(f"  💾 {len(atc5_codes_by_rxcui)} ingredients found in cache")
+        
+        fetched = {
+            rxcui: future.result()
+            for rxcui, future in tqdm(pending.items(), desc="Fetching Level 5 substances", unit="ingredient")
+        }
+        atc5_codes_by_rxcui.update(fetched)
+        
+        # Empty results are usually failed requests, so only store the
+        # others and retry those ingredients next run
+        for rxcui, codes in fetched.items():
+            if codes:
+                cached[rxcui] = codes
+    
+    for rxcui, name in members:
+        for atc5 in atc5_codes_by_rxcui[rxcui]:
+            if len(atc5) == 7 and atc5 not in substances:  # Verify it's Level 5
+                substances[atc5] = {
+                    'code': atc5,
+                    'name': name,
+                    'rxcui': rxcui
+                }
+                print(f"    ✓ Found: {atc5} = {name}")
     
-    pbar.close()
     print(f"\n✅ Found {len(substances)} Level 5 substance codes")
-    return substances
+    return list(substances.values())
 
 
-def get_atc5_for_ingredient(rxcui: str) -> List[str]:
-    """Get ATC Level 5 codes for an ingredient RxCUI."""
+def fetch_class_ingredients(atc_class: str, session=None) -> List[Tuple[str, str]]:
+    """
+    Fetch the ingredients of one ATC class.
+    
+    Args:
+        atc_class: ATC class code (e.g., "C10AA")
+        session: Optional requests.Session to reuse connections
+    
+    Returns:
+        List of (rxcui, name) tuples
+    """
+    http = session if session is not None else SESSION
+    ingredients = []
+    
     try:
-        url = f"https://rxnav.nlm.nih.gov/REST/rxclass/class/byRxcui.json?rxcui={rxcui}&relaSource=ATC"
-        response = requests.get(url, timeout=10)
+        # Get ingredients in this class
+        url = f"https://rxnav.nlm.nih.gov/REST/rxclass/classMembers.json?classId={atc_class}&relaSource=ATC&relas=has_ingredient"
+        response = http.get(url, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
-            drug_info_list = data.get('rxclassDrugInfoList', {}).get('rxclassDrugInfo', [])
-            
-            codes = []
-            for info in drug_info_list:
-                code = info.get('rxclassMinConceptItem', {}).get('classId', '')
-                if code and len(code) == 7:  # Level 5 only
-                    codes.append(code)
+            members = data.get('drugMemberGroup', {}).get('drugMember', [])
             
-            return codes
-    except:
-        pass
+            for member in members:
+                rxcui = member.get('minConcept', {}).get('rxcui')
+                name = member.get('minConcept', {}).get('name', '').strip()
+                
+                if rxcui and name:
+                    ingredients.append((rxcui, name))
+    
+    except Exception as e:
+        tqdm.write(f"    ⚠️  Error fetching {atc_class}: {e}")
     
-    return []
+    return ingredients
+
+
+def get_atc5_for_ingredient(rxcui: str, session=None) -> List[str]:
+    """Get ATC Level 5 codes for an ingredient RxCUI."""
+    http = session if session is not None else SESSION
+    try:
+        return list(fetch_atc5_codes(rxcui, http))
+    except Exception:
+        return []
+
+
+@functools.lru_cache(maxsize=None)
+def fetch_atc5_codes(rxcui: str, http) -> Tuple[str, ...]:
+    """
+    Fetch the ATC Level 5 codes of an ingredient RxCUI.
+    
+    Results are memoized per (rxcui, session). Failed requests raise, so
+    they are not cached and are retried on the next call.
+    
+    Args:
+        rxcui: Ingredient RxCUI
+        http: requests.Session (or the requests module) to fetch with
+    
+    Returns:
+        Tuple of Level 5 ATC codes
+    """
+    url = f"https://rxnav.nlm.nih.gov/REST/rxclass/class/byRxcui.json?rxcui={rxcui}&relaSource=ATC"
+    response = http.get(url, timeout=10)
+    response.raise_for_status()
+    
+    data = response.json()
+    drug_info_list = data.get('rxclassDrugInfoList', {}).get('rxclassDrugInfo', [])
+    
+    codes = []
+    for info in drug_info_list:
+        code = info.get('rxclassMinConceptItem', {}).get('classId', '')
+        if code and len(code) == 7:  # Level 5 only
+            codes.append(code)
+    
+    return tuple(codes)
 
 
 def add_manual_substance_codes() -> List[Dict]:
@@ -219,19 +359,29 @@ def add_manual_substance_codes() -> List[Dict]:
     ]
 
 
-def main():
+def run(data_dir: Path = Path("data"), session=None) -> bool:
+    """
+    Build atc_mapping_complete.json from atc_mapping.json in data_dir.
+    
+    Args:
+        data_dir: Directory containing atc_mapping.json
+        session: Optional requests.Session shared with other steps
+    
+    Returns:
+        True if the complete mapping was written
+    """
     print("\n" + "="*80)
     print("🔧 FIXING ATC HIERARCHY AND ADDING LEVEL 5 SUBSTANCES")
     print("="*80)
     
-    data_dir = Path("data")
+    data_dir = Path(data_dir)
     
     # Load existing ATC mapping
     input_file = data_dir / "atc_mapping.json"
     if not input_file.exists():
         print(f"❌ File not found: {input_file}")
         print("Run: python download_mappings.py --atc first")
-        return
+        return False
     
     print(f"\n📂 Loading: {input_file}")
     atc_simple = load_atc_mapping(input_file)
@@ -245,12 +395,15 @@ def main():
     
     # Process existing codes (Levels 1-4)
     print("\n🔨 Building complete hierarchies for Levels 1-4...")
+    # Parent levels built here are reused for the Level 5 substances below
+    parents_by_prefix = {}
+    hierarchies = build_hierarchies(atc_simple, atc_flat_map, parents_by_prefix)
     for code, name in atc_simple.items():
         atc_enhanced[code] = {
             'code': code,
             'name': name,
             'level': len(code),
-            'hierarchy': build_complete_hierarchy(code, name, atc_flat_map)
+            'hierarchy': hierarchies[code]
         }
     
     print(f"✅ Built hierarchies for {len(atc_enhanced):,} codes")
@@ -267,7 +420,7 @@ def main():
             'code': code,
             'name': name,
             'level': 5,
-            'hierarchy': build_complete_hierarchy(code, name, atc_flat_map)
+            'hierarchy': build_hierarchy(code, name, atc_flat_map, parents_by_prefix)
         }
     
     print(f"✅ Added {len(manual_substances)} Level 5 substance codes")
@@ -277,7 +430,9 @@ def main():
     print("(This may take a minute...)")
     
     try:
-        rxnorm_substances = fetch_substance_level_atc()
+        rxnorm_substances = fetch_substance_level_atc(
+            session=session, cache_file=data_dir / RXCUI_ATC5_CACHE_FILE
+        )
         
         for substance in rxnorm_substances:
             code = substance['code']
@@ -287,7 +442,7 @@ def main():
                     'code': code,
                     'name': name,
                     'level': 5,
-                    'hierarchy': build_complete_hierarchy(code, name, atc_flat_map),
+                    'hierarchy': build_hierarchy(code, name, atc_flat_map, parents_by_prefix),
                     'rxcui': substance.get('rxcui')
                 }
         
@@ -307,17 +462,14 @@ def main():
     print("📊 STATISTICS")
     print("="*80)
     
-    level_counts = {}
-    for code, info in atc_enhanced.items():
-        level = info['level']
-        level_counts[level] = level_counts.get(level, 0) + 1
+    level_counts = Counter(info['level'] for info in atc_enhanced.values())
     
     print(f"\nTotal ATC codes: {len(atc_enhanced):,}")
-    print(f"  Level 1 (Anatomical): {level_counts.get(1, 0):,}")
-    print(f"  Level 2 (Therapeutic): {level_counts.get(3, 0):,}")
-    print(f"  Level 3 (Pharmacological): {level_counts.get(4, 0):,}")
-    print(f"  Level 4 (Chemical): {level_counts.get(5, 0):,}")
-    print(f"  Level 5 (Substance): {level_counts.get(7, 0):,}")
+    print(f"  Level 1 (Anatomical): {level_counts[1]:,}")
+    print(f"  Level 2 (Therapeutic): {level_counts[3]:,}")
+    print(f"  Level 3 (Pharmacological): {level_counts[4]:,}")
+    print(f"  Level 4 (Chemical): {level_counts[5]:,}")
+    print(f"  Level 5 (Substance): {level_counts[7]:,}")
     
     # Show sample with full hierarchy
     print("\n" + "="*80)
@@ -345,6 +497,12 @@ def main():
     print("  ✓ Level 5 substance codes for common drugs")
     print("  ✓ Full hierarchy information for each code")
     print("\n")
+    
+    return True
+
+
+def main():
+    run(Path("data"))
 
 
 if __name__ == "__main__":
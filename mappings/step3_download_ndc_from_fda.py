@@ -9,25 +9,98 @@ Usage:
     python download_ndc_via_api.py --limit 1000     # Download 1000 NDC codes
     python download_ndc_via_api.py --limit 10000    # Download 10000 NDC codes
     python download_ndc_via_api.py --full           # Download ALL available (can take time)
+
+    or import and call run(data_dir, limit=-1, session=...)
 """
 
 import argparse
-import json
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
-import requests
+from typing import Dict, Iterator, List, Optional, Tuple
 from tqdm import tqdm
 
+from step1_download_atc_basic import json_line, make_session, write_json, write_json_items
+
+
+NDC_PAGE_WORKERS = 4  # Concurrent FDA page requests
+FDA_REQUESTS_PER_MINUTE = 240  # FDA API rate limit
 
-def fetch_ndc_batch(skip: int = 0, limit: int = 100) -> List[Dict]:
+
+class RateLimiter:
+    """
+    Spaces out calls from any number of threads to a fixed rate.
+    
+    Each wait() reserves the next free slot and sleeps until it, so
+    concurrent requests never exceed requests_per_minute in total.
+    
+    When responses carry X-RateLimit-Remaining (passed in via update()),
+    calls go through without spacing while the server reports quota left.
+    Once it reports none, calls wait for X-RateLimit-Reset, then return to
+    the fixed rate.
+    """
+    
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute
+        self.next_slot = 0.0
+        self.remaining = None  # Requests the server says are left, if known
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.remaining:
+                self.remaining -= 1
+                slot = now
+            else:
+                slot = max(now, self.next_slot)
+                self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+    
+    def update(self, headers):
+        """Record the quota reported by a response's rate limit headers."""
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+        except (KeyError, ValueError):
+            return
+        
+        with self.lock:
+            self.remaining = max(remaining, 0)
+            if remaining <= 0:
+                self.next_slot = max(self.next_slot, time.monotonic() + reset_delay(headers))
+
+
+def reset_delay(headers) -> float:
+    """Seconds until the quota resets, from X-RateLimit-Reset (0 if unknown)."""
+    try:
+        reset = float(headers['X-RateLimit-Reset'])
+    except (KeyError, ValueError):
+        return 0.0
+    
+    # Either a Unix timestamp or a number of seconds from now
+    if reset > 1e9:
+        reset -= time.time()
+    return max(reset, 0.0)
+
+
+RATE_LIMITER = RateLimiter(FDA_REQUESTS_PER_MINUTE)
+
+# Used when no session is passed in, so calls still share pooled,
+# retrying connections
+SESSION = make_session(retries=5)
+
+
+def fetch_ndc_batch(skip: int = 0, limit: int = 100, session=None) -> List[Dict]:
     """
     Fetch a batch of NDC codes from FDA API.
     
     Args:
         skip: Number of results to skip
         limit: Number of results to fetch (max 1000 per request)
+        session: Optional requests.Session to reuse connections
     
     Returns:
         List of NDC product records
@@ -38,8 +111,12 @@ def fetch_ndc_batch(skip: int = 0, limit: int = 100) -> List[Dict]:
         'limit': min(limit, 1000)  # API max is 1000 per request
     }
     
+    http = session if session is not None else SESSION
+    
     try:
-        response = requests.get(url, params=params, timeout=30)
+        RATE_LIMITER.wait()
+        response = http.get(url, params=params, timeout=30)
+        RATE_LIMITER.update(response.headers)
         response.raise_for_status()
         data = response.json()
         return data.get('results', [])
@@ -48,29 +125,72 @@ def fetch_ndc_batch(skip: int = 0, limit: int = 100) -> List[Dict]:
         return []
 
 
-def download_ndc_mappings(total_limit: int = 10000) -> Dict[str, Dict]:
+def download_ndc_mappings(total_limit: int = 10000, session=None) -> Dict[str, Dict]:
     """
     Download NDC mappings from FDA API.
     
     Args:
         total_limit: Total number of NDC codes to download (use -1 for all)
+        session: Optional requests.Session to reuse connections
     
     Returns:
         Dictionary mapping NDC codes to product information
     """
+    ndc_mapping = dict(iter_ndc_mappings(total_limit, session=session))
+    print(f"\n✅ Downloaded {len(ndc_mapping):,} unique NDC codes")
+    return ndc_mapping
+
+
+def download_ndc_mappings_jsonl(output_file: Path, total_limit: int = 10000, session=None) -> int:
+    """
+    Download NDC mappings from FDA API straight into a JSONL file.
+    
+    Each NDC is written as one {code: info} line as soon as its page is
+    processed, so the full mapping is never held in memory. A code that
+    appears again is written again; the later line wins, as it would in
+    download_ndc_mappings().
+    
+    Args:
+        output_file: JSONL file to write
+        total_limit: Total number of NDC codes to download (use -1 for all)
+        session: Optional requests.Session to reuse connections
+    
+    Returns:
+        Number of lines written
+    """
+    written = 0
+    with open(output_file, 'wb') as f:
+        for ndc_code, info in iter_ndc_mappings(total_limit, session=session):
+            f.write(json_line({ndc_code: info}))
+            written += 1
+    
+    print(f"\n✅ Downloaded {written:,} NDC records")
+    return written
+
+
+def iter_ndc_mappings(total_limit: int = 10000, session=None) -> Iterator[Tuple[str, Dict]]:
+    """
+    Download NDC product records from FDA API and yield them in order.
+    
+    Args:
+        total_limit: Total number of NDC codes to download (use -1 for all)
+        session: Optional requests.Session to reuse connections
+    
+    Yields:
+        (ndc_code, product information) tuples
+    """
     print("\n" + "="*80)
     print("📋 DOWNLOADING NDC MAPPINGS FROM FDA API")
     print("="*80)
     
-    ndc_mapping = {}
-    skip = 0
+    http = session if session is not None else SESSION
     batch_size = 1000  # FDA API max per request
     
     # Determine total to fetch
     if total_limit == -1:
         # First, get the total count
         try:
-            response = requests.get("https://api.fda.gov/drug/ndc.json?limit=1", timeout=10)
+            response = http.get("https://api.fda.gov/drug/ndc.json?limit=1", timeout=10)
             data = response.json()
             total_available = data.get('meta', {}).get('results', {}).get('total', 100000)
             total_limit = total_available
@@ -85,132 +205,138 @@ def download_ndc_mappings(total_limit: int = 10000) -> Dict[str, Dict]:
     pbar = tqdm(total=total_limit, desc="Downloading NDC codes", unit="codes", 
                 bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]')
     
-    while skip < total_limit:
-        remaining = total_limit - skip
-        current_batch_size = min(batch_size, remaining)
-        
-        results = fetch_ndc_batch(skip=skip, limit=current_batch_size)
-        
-        if not results:
-            pbar.write("⚠️  No more results available")
-            break
+    # Every page is known once the total is, so they are requested
+    # concurrently (within the FDA rate limit) and processed in order
+    ranges = [(skip, min(batch_size, total_limit - skip)) for skip in range(0, total_limit, batch_size)]
+    with ThreadPoolExecutor(max_workers=NDC_PAGE_WORKERS) as executor:
+        futures = [executor.submit(fetch_ndc_batch, skip=skip, limit=size, session=session)
+                   for skip, size in ranges]
         
-        # Process results
-        for record in results:
-            # Get NDC code (various formats in FDA data)
-            product_ndc = record.get('product_ndc', '').strip()
-            package_ndc = record.get('packaging', [{}])[0].get('package_ndc', '').strip() if record.get('packaging') else ''
-            ndc_code = product_ndc or package_ndc
+        for (skip, current_batch_size), future in zip(ranges, futures):
+            results = future.result()
             
-            if not ndc_code:
-                continue
+            if not results:
+                pbar.write("⚠️  No more results available")
+                break
             
-            # Extract product information
-            brand_name = record.get('brand_name', '')
-            generic_name = record.get('generic_name', '')
-            dosage_form = record.get('dosage_form', '')
-            route = ', '.join(record.get('route', [])) if record.get('route') else ''
+            for record in results:
+                entry = process_ndc_record(record)
+                if entry is not None:
+                    yield entry
             
-            # Get active ingredients
-            active_ingredients = []
-            if record.get('active_ingredients'):
-                for ing in record.get('active_ingredients', []):
-                    name = ing.get('name', '')
-                    strength = ing.get('strength', '')
-                    if name:
-                        active_ingredients.append(f"{name} {strength}".strip())
+            pbar.update(len(results))
             
-            # Get manufacturer
-            labeler = record.get('labeler_name', '')
-            
-            # Build description
-            description = brand_name or generic_name or "Unknown Product"
-            if dosage_form:
-                description += f" - {dosage_form}"
-            if route:
-                description += f" ({route})"
-            
-            # Store full info
-            ndc_mapping[ndc_code] = {
-                'description': description,
-                'brand_name': brand_name,
-                'generic_name': generic_name,
-                'dosage_form': dosage_form,
-                'route': route,
-                'active_ingredients': active_ingredients,
-                'labeler': labeler,
-                'product_type': record.get('product_type', '')
-            }
-        
-        skip += len(results)
-        pbar.update(len(results))
-        
-        # Rate limiting - be nice to FDA API
-        time.sleep(0.5)
+            # Stop if we got fewer results than expected (end of data)
+            if len(results) < current_batch_size:
+                pbar.write(f"✅ Reached end of available data at {skip + len(results):,} records")
+                break
         
-        # Stop if we got fewer results than expected (end of data)
-        if len(results) < current_batch_size:
-            pbar.write(f"✅ Reached end of available data at {skip:,} records")
-            break
+        # Pages past the end of the data are not needed
+        for pending in futures:
+            pending.cancel()
     
     pbar.close()
-    print(f"\n✅ Downloaded {len(ndc_mapping):,} unique NDC codes")
-    return ndc_mapping
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description='Download NDC mappings using FDA OpenFDA API',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
-  %(prog)s --limit 1000       # Download 1,000 NDC codes (quick test)
-  %(prog)s --limit 10000      # Download 10,000 NDC codes (recommended)
-  %(prog)s --full             # Download ALL available (can take 30+ mins)
+def process_ndc_record(record: Dict) -> Optional[Tuple[str, Dict]]:
+    """
+    Extract the NDC code and product information from one FDA record.
+    
+    Called once per record for the whole NDC directory, so each field is
+    read once through a pre-bound record.get.
+    
+    Args:
+        record: Product record from the FDA NDC API
+    
+    Returns:
+        (ndc_code, product information) tuple, or None if the record has
+        no NDC code
+    """
+    get = record.get
+    
+    # Get NDC code (various formats in FDA data)
+    ndc_code = get('product_ndc', '').strip()
+    if not ndc_code:
+        packaging = get('packaging') or ()
+        ndc_code = packaging[0].get('package_ndc', '').strip() if packaging else ''
+        if not ndc_code:
+            return None
+    
+    # Extract product information
+    brand_name = get('brand_name', '')
+    generic_name = get('generic_name', '')
+    dosage_form = get('dosage_form', '')
+    routes = get('route')
+    route = ', '.join(routes) if routes else ''
+    
+    # Get active ingredients
+    active_ingredients = [
+        f"{name} {ing.get('strength', '')}".strip()
+        for ing in get('active_ingredients') or ()
+        if (name := ing.get('name', ''))
+    ]
+    
+    # Build description
+    parts = [brand_name or generic_name or "Unknown Product"]
+    if dosage_form:
+        parts.append(f" - {dosage_form}")
+    if route:
+        parts.append(f" ({route})")
+    
+    return ndc_code, {
+        'description': ''.join(parts),
+        'brand_name': brand_name,
+        'generic_name': generic_name,
+        'dosage_form': dosage_form,
+        'route': route,
+        'active_ingredients': active_ingredients,
+        'labeler': get('labeler_name', ''),
+        'product_type': get('product_type', '')
+    }
 
-Output:
-  data/ndc_mapping.json       # Full NDC information
-  data/ndc_mapping_simple.json # Just code → description
 
-Note: FDA API rate limit is 240 requests/minute (1000/request)
-      Full download may take 20-30 minutes for ~100k codes
-        """
-    )
-    
-    parser.add_argument('--limit', type=int, default=10000,
-                       help='Number of NDC codes to download (default: 10000)')
-    parser.add_argument('--full', action='store_true',
-                       help='Download all available NDC codes')
-    parser.add_argument('--data-dir', default='data',
-                       help='Output directory (default: data/)')
+def run(data_dir: Path, limit: int = 10000, session=None, jsonl: bool = False) -> bool:
+    """
+    Download NDC mappings from the FDA API and save them to data_dir.
     
-    args = parser.parse_args()
+    Args:
+        data_dir: Output directory (created if missing)
+        limit: Number of NDC codes to download (-1 for all)
+        session: Optional requests.Session shared with other steps
+        jsonl: Stream records to ndc_mapping.jsonl instead of writing
+            ndc_mapping.json and ndc_mapping_simple.json
     
-    data_dir = Path(args.data_dir)
+    Returns:
+        True if the mapping files were written
+    """
+    data_dir = Path(data_dir)
     data_dir.mkdir(parents=True, exist_ok=True)
     
-    # Set limit
-    limit = -1 if args.full else args.limit
+    if jsonl:
+        output_file = data_dir / "ndc_mapping.jsonl"
+        if not download_ndc_mappings_jsonl(output_file, total_limit=limit, session=session):
+            print("\n❌ Failed to download NDC mappings")
+            return False
+        print(f"\n💾 Saved NDC mapping to: {output_file}")
+        return True
     
     # Download
-    ndc_mapping = download_ndc_mappings(total_limit=limit)
+    ndc_mapping = download_ndc_mappings(total_limit=limit, session=session)
     
     if not ndc_mapping:
         print("\n❌ Failed to download NDC mappings")
-        sys.exit(1)
+        return False
     
     # Save full mapping
     output_file = data_dir / "ndc_mapping.json"
     print(f"\n💾 Saving full mapping to: {output_file}")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(ndc_mapping, f, indent=2, ensure_ascii=False)
+    write_json(output_file, ndc_mapping)
     
-    # Save simple mapping (just code → description)
-    simple_mapping = {code: info['description'] for code, info in ndc_mapping.items()}
+    # Save simple mapping (just code → description), streamed from the
+    # full mapping rather than copied into a second dict
     simple_file = data_dir / "ndc_mapping_simple.json"
     print(f"💾 Saving simple mapping to: {simple_file}")
-    with open(simple_file, 'w', encoding='utf-8') as f:
-        json.dump(simple_mapping, f, indent=2, ensure_ascii=False)
+    write_json_items(simple_file, ((code, info['description']) for code, info in ndc_mapping.items()))
     
     # Show sample
     print("\n" + "="*80)
@@ -236,6 +362,47 @@ Note: FDA API rate limit is 240 requests/minute (1000/request)
     print(f"  ndc_full = json.load(open('{output_file}'))")
     print(f"  ndc_simple = json.load(open('{simple_file}'))")
     print("\n")
+    
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Download NDC mappings using FDA OpenFDA API',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --limit 1000       # Download 1,000 NDC codes (quick test)
+  %(prog)s --limit 10000      # Download 10,000 NDC codes (recommended)
+  %(prog)s --full             # Download ALL available (can take 30+ mins)
+
+Output:
+  data/ndc_mapping.json       # Full NDC information
+  data/ndc_mapping_simple.json # Just code → description
+  data/ndc_mapping.jsonl      # With --jsonl: one {code: info} per line instead
+                              # (read by build_sqlite.py and lookup_code.py)
+
+Note: FDA API rate limit is 240 requests/minute (1000/request)
+      Full download may take 20-30 minutes for ~100k codes
+        """
+    )
+    
+    parser.add_argument('--limit', type=int, default=10000,
+                       help='Number of NDC codes to download (default: 10000)')
+    parser.add_argument('--full', action='store_true',
+                       help='Download all available NDC codes')
+    parser.add_argument('--data-dir', default='data',
+                       help='Output directory (default: data/)')
+    parser.add_argument('--jsonl', action='store_true',
+                       help='Stream records to ndc_mapping.jsonl instead of writing the JSON files')
+    
+    args = parser.parse_args()
+    
+    # Set limit
+    limit = -1 if args.full else args.limit
+    
+    if not run(Path(args.data_dir), limit=limit, jsonl=args.jsonl):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -10,19 +10,134 @@ Date: October 2025
 
 Usage:
     python ndc_to_atc_converter.py <NDC_CODE>
-    or import and use the NDCtoATCConverter class
+    or import and use the NDCtoATCConverter / AsyncNDCtoATCConverter classes
 """
 
+import asyncio
+import functools
+import httpx
 import requests
 import json
 import sys
-from typing import List, Dict, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
+from urllib3.util.retry import Retry
+
+from rxnav_cache import DEFAULT_CACHE_TTL, ResponseCache
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, fall back to the standard library
+    orjson = None
+
+
+MEMO_TTL = 600  # Seconds a decoded response is reused within one converter
+MEMO_SIZE = 4096  # Decoded responses kept per converter
+NDC_BATCH_SIZE = 20  # NDC codes per /ndcproperties.json request
+SESSION_POOL_SIZE = 32  # Keep-alive connections held by the shared session
+
+# RxNav API paths, relative to BASE_URL; %s is the NDC code(s) or RxCUI
+_PATH_RXCUI = "/rxcui.json?idtype=NDC&id=%s"
+_PATH_NDC_PROPERTIES = "/ndcproperties.json?id=%s"
+_PATH_PROPERTIES = "/rxcui/%s/properties.json"
+_PATH_ATC = "/rxclass/class/byRxcui.json?rxcui=%s&relaSource=ATC"
+_PATH_INGREDIENTS = "/rxcui/%s/related.json?tty=IN"
+
+# A key every non-empty response of the matching endpoint contains. Bodies
+# without it (unknown NDCs, RxCUIs without classes) are not decoded at all
+_KEY_RXCUI = b'"rxnormId"'
+_KEY_NDC_PROPERTIES = b'"ndcProperty"'
+_KEY_PROPERTIES = b'"properties"'
+_KEY_ATC = b'"rxclassDrugInfo"'
+_KEY_INGREDIENTS = b'"conceptProperties"'
+
+# Deletes hyphens and spaces from an NDC code in one pass
+_NDC_SEPARATORS = str.maketrans('', '', '- ')
+
+
+def _loads(data: bytes, required: Optional[bytes] = None):
+    """
+    Parse a JSON response body, using orjson when it is installed.
+    
+    If required is given and does not occur in the body, the response is an
+    empty result and {} is returned without parsing it. A malformed body
+    raises ValueError (both decoders' JSONDecodeError subclass it), which
+    the lookup methods catch next to request errors.
+    """
+    if required is not None and required not in data:
+        return {}
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# One requests.Session for every NDCtoATCConverter, so TLS sessions and
+# keep-alive connections survive across converter instances
+_SHARED_SESSION: Optional[requests.Session] = None
+_SHARED_SESSION_LOCK = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Return the module-wide session, creating it on first use"""
+    global _SHARED_SESSION
+    with _SHARED_SESSION_LOCK:
+        if _SHARED_SESSION is None:
+            session = requests.Session()
+            # Enough keep-alive connections for several converters' worker
+            # threads; transient failures (429, 5xx, dropped connections) are
+            # retried with backoff
+            retry = Retry(total=3, backoff_factor=0.2, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(['GET']))
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=SESSION_POOL_SIZE, max_retries=retry)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _SHARED_SESSION = session
+        return _SHARED_SESSION
+
+
+class _ResponseMemo:
+    """
+    In-memory TTL cache of decoded API responses, keyed by URL.
+    
+    Products of a batch often share ingredients, so the same RxCUI lookups
+    repeat within a run. The memo answers those without an HTTP call or a
+    JSON decode (and without a ResponseCache query). Once full, the oldest
+    entry is dropped. Safe to share between threads.
+    """
+    
+    def __init__(self, ttl: float = MEMO_TTL, maxsize: int = MEMO_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, url: str) -> Optional[Dict]:
+        """Return the decoded response for url, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+    
+    def set(self, url: str, data: Dict):
+        """Store the decoded response for url"""
+        with self._lock:
+            self._entries.pop(url, None)
+            if len(self._entries) >= self.maxsize:
+                del self._entries[next(iter(self._entries))]
+            self._entries[url] = (time.monotonic(), data)
 
 
 @dataclass
 class DrugInfo:
     """Stores information about a drug and its codes"""
+    # No per-instance __dict__: batch conversions can hold thousands of these.
+    # Spelled out because dataclass(slots=True) needs Python 3.10
+    __slots__ = ('ndc_code', 'rxcui', 'drug_name', 'atc_codes')
+    
     ndc_code: str
     rxcui: Optional[str]
     drug_name: Optional[str]
@@ -32,6 +147,110 @@ class DrugInfo:
         return f"NDC: {self.ndc_code}, RxCUI: {self.rxcui}, Drug: {self.drug_name}, ATCs: {len(self.atc_codes)}"
 
 
+def _normalize_ndc(ndc: str) -> str:
+    """Remove hyphens and spaces from an NDC code and pad it to 11 digits"""
+    # Remove hyphens and spaces
+    ndc_clean = ndc.translate(_NDC_SEPARATORS)
+    
+    # Left-pad short codes with zeros (10 digits is the common case);
+    # zfill leaves 11-digit codes untouched
+    return ndc_clean.zfill(11) if len(ndc_clean) <= 11 else ndc_clean
+
+
+def _parse_rxcui(data: Dict) -> Optional[str]:
+    """Extract the first RxCUI from a /rxcui.json response"""
+    rxcuis = data.get('idGroup', {}).get('rxnormId', [])
+    return rxcuis[0] if rxcuis else None
+
+
+def _parse_ndc_rxcuis(data: Dict, ndcs: List[str]) -> Dict[str, str]:
+    """
+    Extract NDC -> RxCUI pairs from a multi-id /ndcproperties.json response.
+    
+    Only the (normalized, 11-digit) NDCs in ndcs are kept, each with the
+    first RxCUI listed for it.
+    """
+    wanted = set(ndcs)
+    found = {}
+    properties = (data.get('ndcPropertyList') or {}).get('ndcProperty', [])
+    
+    for prop in properties:
+        ndc = prop.get('ndcItem')
+        rxcui = prop.get('rxcui')
+        if ndc in wanted and rxcui and ndc not in found:
+            found[ndc] = rxcui
+    
+    return found
+
+
+def _chunks(items: List[str], size: int = NDC_BATCH_SIZE) -> List[List[str]]:
+    """Split items into lists of at most size elements"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _parse_drug_name(data: Dict) -> Optional[str]:
+    """Extract the drug name from a /properties.json response"""
+    return data.get('properties', {}).get('name')
+
+
+def _parse_atc_codes(data: Dict) -> List[Dict[str, str]]:
+    """
+    Extract {atc_code, class_name, class_type} dicts from a /class/byRxcui.json response.
+    
+    The class list is reached with direct indexing, and each class item is
+    read through a bound .get, since this runs for every class of every
+    lookup, including ones answered from the cache.
+    """
+    try:
+        drug_info_list = data['rxclassDrugInfoList']['rxclassDrugInfo']
+    except KeyError:
+        return []
+    
+    atc_list = []
+    append = atc_list.append
+    
+    for drug_info in drug_info_list:
+        rx_class_item = drug_info.get('rxclassMinConceptItem')
+        if not rx_class_item:
+            continue
+        get = rx_class_item.get
+        atc_code = get('classId', '')
+        
+        if atc_code:
+            append({
+                'atc_code': atc_code,
+                'class_name': get('className', ''),
+                'class_type': get('classType', '')
+            })
+    
+    return atc_list
+
+
+def _parse_ingredients(data: Dict) -> List[str]:
+    """Extract ingredient (tty=IN) RxCUIs from a /related.json response"""
+    ingredients = []
+    concept_group = data.get('relatedGroup', {}).get('conceptGroup', [])
+    
+    for group in concept_group:
+        if group.get('tty') == 'IN':  # Ingredient
+            properties = group.get('conceptProperties', [])
+            for prop in properties:
+                ing_rxcui = prop.get('rxcui')
+                if ing_rxcui:
+                    ingredients.append(ing_rxcui)
+    
+    return ingredients
+
+
+def _unique_atc_codes(atc_codes: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Remove duplicates based on atc_code, keeping the first occurrence"""
+    # Dicts keep insertion order, so one dict replaces a seen set plus a list
+    unique_atc_codes = {}
+    for atc in atc_codes:
+        unique_atc_codes.setdefault(atc['atc_code'], atc)
+    return list(unique_atc_codes.values())
+
+
 class NDCtoATCConverter:
     """
     Converts NDC codes to ATC codes using the RxNorm API.
@@ -44,20 +263,83 @@ class NDCtoATCConverter:
     
     BASE_URL = "https://rxnav.nlm.nih.gov/REST"
     
-    def __init__(self, verbose: bool = False):
+    def __init__(self, verbose: bool = False, max_workers: int = 8,
+                 cache: Optional[ResponseCache] = None,
+                 session: Optional[requests.Session] = None):
         """
         Initialize the converter.
         
         Args:
             verbose: If True, print detailed information during conversion
+            max_workers: Maximum number of threads issuing API calls at once
+            cache: Optional ResponseCache used to skip repeated API calls
+            session: Optional requests.Session to use instead of the shared one
         """
         self.verbose = verbose
-        self.session = requests.Session()
+        self.max_workers = max_workers
+        self.cache = cache
+        self._memo = _ResponseMemo()
+        self._log_lock = threading.Lock()
+        self.session = session if session is not None else _get_session()
         
+        # Full URL templates, built once from BASE_URL (which a subclass or
+        # instance may override)
+        self._url_rxcui = self.BASE_URL + _PATH_RXCUI
+        self._url_ndc_properties = self.BASE_URL + _PATH_NDC_PROPERTIES
+        self._url_properties = self.BASE_URL + _PATH_PROPERTIES
+        self._url_atc = self.BASE_URL + _PATH_ATC
+        self._url_ingredients = self.BASE_URL + _PATH_INGREDIENTS
+    
     def _log(self, message: str):
         """Print message if verbose mode is enabled"""
         if self.verbose:
-            print(f"[INFO] {message}")
+            with self._log_lock:
+                print(f"[INFO] {message}")
+    
+    def _cached_get(self, url: str, required: Optional[bytes] = None) -> Dict:
+        """
+        GET a URL and decode the JSON body, going through the memo and cache.
+        
+        A 404, or a body without the required key, decodes to {}.
+        """
+        data = self._memo.get(url)
+        if data is None:
+            data = self._fetch(url, required)
+            self._memo.set(url, data)
+        return data
+    
+    def _fetch(self, url: str, required: Optional[bytes] = None) -> Dict:
+        """GET a URL and decode the JSON body, going through the cache if set"""
+        if self.cache is None:
+            response = self.session.get(url, timeout=10)
+            # Unknown codes are a 404 with nothing worth decoding
+            if response.status_code == 404:
+                return {}
+            response.raise_for_status()
+            return _loads(response.content, required)
+        
+        body = self.cache.get(url)
+        if body is not None:
+            self._log(f"Cache hit: {url}")
+            return _loads(body, required)
+        
+        # Expired entries are revalidated instead of downloaded again
+        response = self.session.get(url, headers=self.cache.validators(url), timeout=10)
+        if response.status_code == 304:
+            body = self.cache.refresh(url)
+            if body is not None:
+                self._log(f"Not modified: {url}")
+                return _loads(body, required)
+            response = self.session.get(url, timeout=10)
+        
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        # Decoded first so a malformed body is never cached
+        data = _loads(response.content, required)
+        self.cache.set(url, response.content,
+                       response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return data
     
     def normalize_ndc(self, ndc: str) -> str:
         """
@@ -69,16 +351,7 @@ class NDCtoATCConverter:
         Returns:
             Normalized 11-digit NDC code
         """
-        # Remove hyphens and spaces
-        ndc_clean = ndc.replace('-', '').replace(' ', '')
-        
-        # Pad to 11 digits if needed
-        if len(ndc_clean) == 10:
-            # Most common: need to pad first segment
-            # Split based on common patterns and pad appropriately
-            ndc_clean = '0' + ndc_clean
-        
-        return ndc_clean
+        return _normalize_ndc(ndc)
     
     def get_rxcui_from_ndc(self, ndc_code: str) -> Optional[str]:
         """
@@ -94,28 +367,64 @@ class NDCtoATCConverter:
         ndc_normalized = self.normalize_ndc(ndc_code)
         self._log(f"Looking up RxCUI for NDC code: {ndc_code} (normalized: {ndc_normalized})")
         
-        url = f"{self.BASE_URL}/rxcui.json?idtype=NDC&id={ndc_normalized}"
+        url = self._url_rxcui % ndc_normalized
         
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._cached_get(url, _KEY_RXCUI)
             
             # Extract RxCUI from response
-            rxcuis = data.get('idGroup', {}).get('rxnormId', [])
+            rxcui = _parse_rxcui(data)
             
-            if rxcuis:
-                rxcui = rxcuis[0]
+            if rxcui:
                 self._log(f"Found RxCUI: {rxcui}")
-                return rxcui
             else:
                 self._log(f"No RxCUI found for NDC code: {ndc_code}")
-                return None
+            
+            return rxcui
                 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"Error querying RxNorm API: {e}")
             return None
     
+    def get_rxcuis_from_ndcs(self, ndc_codes: List[str]) -> Dict[str, str]:
+        """
+        Resolve many NDC codes to RxCUIs with one request per batch.
+        
+        Uses the multi-id form of /ndcproperties.json, so a batch of 20
+        codes costs one round-trip instead of twenty. Codes it does not
+        list are left out; convert() then looks them up one at a time.
+        
+        Args:
+            ndc_codes: NDC codes in any format
+            
+        Returns:
+            Dictionary of normalized NDC code -> RxCUI
+        """
+        batches = _chunks(list(dict.fromkeys(_normalize_ndc(ndc.strip()) for ndc in ndc_codes)))
+        if not batches:
+            return {}
+        
+        rxcuis = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            for found in executor.map(self._get_rxcui_batch, batches):
+                rxcuis.update(found)
+        return rxcuis
+    
+    def _get_rxcui_batch(self, ndcs: List[str]) -> Dict[str, str]:
+        """Resolve at most NDC_BATCH_SIZE normalized NDC codes to RxCUIs"""
+        self._log(f"Looking up RxCUIs for NDC codes: {ndcs}")
+        
+        url = self._url_ndc_properties % '+'.join(ndcs)
+        
+        try:
+            found = _parse_ndc_rxcuis(self._cached_get(url, _KEY_NDC_PROPERTIES), ndcs)
+            self._log(f"Found RxCUIs for {len(found)} of {len(ndcs)} NDC code(s)")
+            return found
+            
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._log(f"Error looking up NDC properties: {e}")
+            return {}
+    
     def get_drug_name(self, rxcui: str) -> Optional[str]:
         """
         Get the drug name for an RxCUI.
@@ -126,22 +435,19 @@ class NDCtoATCConverter:
         Returns:
             Drug name or None if not found
         """
-        url = f"{self.BASE_URL}/rxcui/{rxcui}/properties.json"
+        url = self._url_properties % rxcui
         
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._cached_get(url, _KEY_PROPERTIES)
             
-            properties = data.get('properties', {})
-            name = properties.get('name')
+            name = _parse_drug_name(data)
             
             if name:
                 self._log(f"Drug name for RxCUI {rxcui}: {name}")
                 
             return name
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             self._log(f"Error getting drug name: {e}")
             return None
     
@@ -158,30 +464,12 @@ class NDCtoATCConverter:
         """
         self._log(f"Looking up ATC codes for RxCUI: {rxcui}")
         
-        url = f"{self.BASE_URL}/rxclass/class/byRxcui.json?rxcui={rxcui}&relaSource=ATC"
+        url = self._url_atc % rxcui
         
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._cached_get(url, _KEY_ATC)
             
-            atc_list = []
-            
-            # Extract ATC codes from rxclassDrugInfoList
-            drug_info_list = data.get('rxclassDrugInfoList', {}).get('rxclassDrugInfo', [])
-            
-            for drug_info in drug_info_list:
-                rx_class_item = drug_info.get('rxclassMinConceptItem', {})
-                atc_code = rx_class_item.get('classId', '')
-                class_name = rx_class_item.get('className', '')
-                class_type = rx_class_item.get('classType', '')
-                
-                if atc_code:
-                    atc_list.append({
-                        'atc_code': atc_code,
-                        'class_name': class_name,
-                        'class_type': class_type
-                    })
+            atc_list = _parse_atc_codes(data)
             
             if atc_list:
                 self._log(f"Found {len(atc_list)} ATC code(s)")
@@ -190,7 +478,7 @@ class NDCtoATCConverter:
                 
             return atc_list
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"Error querying RxClass API: {e}")
             return []
     
@@ -207,23 +495,12 @@ class NDCtoATCConverter:
         """
         self._log(f"Looking up related ingredients for RxCUI: {rxcui}")
         
-        url = f"{self.BASE_URL}/rxcui/{rxcui}/related.json?tty=IN"
+        url = self._url_ingredients % rxcui
         
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            ingredients = []
-            concept_group = data.get('relatedGroup', {}).get('conceptGroup', [])
+            data = self._cached_get(url, _KEY_INGREDIENTS)
             
-            for group in concept_group:
-                if group.get('tty') == 'IN':  # Ingredient
-                    properties = group.get('conceptProperties', [])
-                    for prop in properties:
-                        ing_rxcui = prop.get('rxcui')
-                        if ing_rxcui:
-                            ingredients.append(ing_rxcui)
+            ingredients = _parse_ingredients(data)
             
             if ingredients:
                 self._log(f"Found {len(ingredients)} ingredient(s)")
@@ -232,16 +509,19 @@ class NDCtoATCConverter:
                 
             return ingredients
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             self._log(f"Error getting related ingredients: {e}")
             return []
     
-    def convert(self, ndc_code: str) -> DrugInfo:
+    def convert(self, ndc_code: str, rxcui: Optional[str] = None,
+                fetch_name: bool = True) -> DrugInfo:
         """
         Convert an NDC code to ATC codes.
         
         Args:
             ndc_code: The NDC code to convert (e.g., '00093-7570-98' or '00093757098')
+            rxcui: RxCUI of the NDC if already known (e.g. from get_rxcuis_from_ndcs)
+            fetch_name: If False, skip the drug name request and leave drug_name None
             
         Returns:
             DrugInfo object containing the conversion results
@@ -252,7 +532,8 @@ class NDCtoATCConverter:
         self._log(f"Starting conversion for NDC code: {ndc_code}")
         
         # Step 1: Get RxCUI from NDC code
-        rxcui = self.get_rxcui_from_ndc(ndc_code)
+        if rxcui is None:
+            rxcui = self.get_rxcui_from_ndc(ndc_code)
         
         if not rxcui:
             return DrugInfo(
@@ -262,8 +543,29 @@ class NDCtoATCConverter:
                 atc_codes=[]
             )
         
-        # Step 2: Get drug name
-        drug_name = self.get_drug_name(rxcui)
+        drug_name, atc_codes = self._lookup_rxcui(rxcui, fetch_name)
+        
+        return DrugInfo(
+            ndc_code=ndc_code,
+            rxcui=rxcui,
+            drug_name=drug_name,
+            atc_codes=atc_codes
+        )
+    
+    def _lookup_rxcui(self, rxcui: str,
+                      fetch_name: bool = True) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """
+        Get the drug name and ATC codes of an RxCUI.
+        
+        Args:
+            rxcui: The RxNorm Concept Unique Identifier
+            fetch_name: If False, skip the drug name request and return None for it
+            
+        Returns:
+            Tuple of (drug name or None, unique ATC codes)
+        """
+        # Step 2: Get drug name (one request callers can opt out of)
+        drug_name = self.get_drug_name(rxcui) if fetch_name else None
         
         # Step 3: Get ATC codes - first try the product RxCUI
         atc_codes = self.get_atc_codes_from_rxcui(rxcui)
@@ -273,19 +575,335 @@ class NDCtoATCConverter:
         if not atc_codes:
             self._log("No ATC codes at product level, checking ingredient level")
             ingredients = self.get_related_ingredients(rxcui)
-            for ingredient_rxcui in ingredients:
-                ing_atc_codes = self.get_atc_codes_from_rxcui(ingredient_rxcui)
-                atc_codes.extend(ing_atc_codes)
+            # Ingredients are looked up on a bounded thread pool; map() keeps their order
+            if ingredients:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(ingredients))) as executor:
+                    for ing_atc_codes in executor.map(self.get_atc_codes_from_rxcui, ingredients):
+                        atc_codes.extend(ing_atc_codes)
         
         # Remove duplicates based on atc_code
-        if atc_codes:
-            seen = set()
-            unique_atc_codes = []
-            for atc in atc_codes:
-                if atc['atc_code'] not in seen:
-                    seen.add(atc['atc_code'])
-                    unique_atc_codes.append(atc)
-            atc_codes = unique_atc_codes
+        return drug_name, _unique_atc_codes(atc_codes)
+    
+    def convert_batch(self, ndc_codes: List[str], fetch_name: bool = True) -> List[DrugInfo]:
+        """
+        Convert multiple NDC codes to ATC codes.
+        
+        The RxCUIs of all codes are resolved up front in batched requests;
+        only codes missing from those are looked up one at a time. Many
+        NDCs (package sizes of one product) share an RxCUI, so the name and
+        ATC codes are then looked up once per distinct RxCUI and copied to
+        every code that has it.
+        
+        Args:
+            ndc_codes: List of NDC codes to convert
+            fetch_name: If False, skip the drug name requests and leave drug_name None
+            
+        Returns:
+            List of DrugInfo objects
+        """
+        ndc_codes = [ndc_code.strip() for ndc_code in ndc_codes]
+        if not ndc_codes:
+            return []
+        
+        normalized = [_normalize_ndc(ndc_code) for ndc_code in ndc_codes]
+        rxcuis = self.get_rxcuis_from_ndcs(ndc_codes) if len(ndc_codes) > 1 else {}
+        missing = list(dict.fromkeys(ndc for ndc in normalized if ndc not in rxcuis))
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(ndc_codes))) as executor:
+            for ndc, rxcui in zip(missing, executor.map(self.get_rxcui_from_ndc, missing)):
+                if rxcui:
+                    rxcuis[ndc] = rxcui
+            
+            unique_rxcuis = list(dict.fromkeys(rxcuis[ndc] for ndc in normalized if ndc in rxcuis))
+            self._log(f"Looking up {len(unique_rxcuis)} distinct RxCUI(s) for {len(ndc_codes)} NDC code(s)")
+            details = dict(zip(unique_rxcuis, executor.map(
+                functools.partial(self._lookup_rxcui, fetch_name=fetch_name), unique_rxcuis
+            )))
+        
+        results = []
+        for ndc_code, ndc in zip(ndc_codes, normalized):
+            rxcui = rxcuis.get(ndc)
+            drug_name, atc_codes = details[rxcui] if rxcui else (None, [])
+            results.append(DrugInfo(
+                ndc_code=ndc_code,
+                rxcui=rxcui,
+                drug_name=drug_name,
+                atc_codes=list(atc_codes)
+            ))
+        return results
+
+
+class AsyncNDCtoATCConverter:
+    """
+    Asynchronous NDC to ATC converter built on httpx.
+    
+    Performs the same lookups as NDCtoATCConverter, but the conversions of
+    a batch are issued concurrently, so a batch takes about as long as its
+    slowest code instead of the sum of all of them. Requests are
+    multiplexed over HTTP/2, so after the first call they share one TLS
+    connection to rxnav.nlm.nih.gov.
+    
+    Must be used as an async context manager:
+    
+        async with AsyncNDCtoATCConverter() as converter:
+            result = await converter.convert('00093-7570-98')
+    """
+    
+    BASE_URL = NDCtoATCConverter.BASE_URL
+    
+    def __init__(self, verbose: bool = False, max_concurrency: int = 8,
+                 cache: Optional[ResponseCache] = None):
+        """
+        Initialize the converter.
+        
+        Args:
+            verbose: If True, print detailed information during conversion
+            max_concurrency: Maximum number of NDC codes converted at once by convert_batch
+            cache: Optional ResponseCache used to skip repeated API calls
+        """
+        self.verbose = verbose
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self._memo = _ResponseMemo()
+        self.client: Optional[httpx.AsyncClient] = None
+    
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            http2=True,
+            base_url=self.BASE_URL,
+            timeout=10,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32)
+        )
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.client.aclose()
+        self.client = None
+    
+    def _log(self, message: str):
+        """Print message if verbose mode is enabled"""
+        if self.verbose:
+            print(f"[INFO] {message}")
+    
+    async def _cached_get(self, path: str, required: Optional[bytes] = None) -> Dict:
+        """
+        GET an API path and decode the JSON body, going through the memo and cache.
+        
+        A 404, or a body without the required key, decodes to {}.
+        """
+        # Keyed by the full URL so the cache is shared with NDCtoATCConverter
+        url = f"{self.BASE_URL}{path}"
+        data = self._memo.get(url)
+        if data is None:
+            data = await self._fetch(path, url, required)
+            self._memo.set(url, data)
+        return data
+    
+    async def _fetch(self, path: str, url: str, required: Optional[bytes] = None) -> Dict:
+        """GET an API path and decode the JSON body, going through the cache if set"""
+        if self.cache is None:
+            response = await self.client.get(path)
+            # Unknown codes are a 404 with nothing worth decoding
+            if response.status_code == 404:
+                return {}
+            response.raise_for_status()
+            return _loads(response.content, required)
+        
+        body = self.cache.get(url)
+        if body is not None:
+            self._log(f"Cache hit: {url}")
+            return _loads(body, required)
+        
+        # Expired entries are revalidated instead of downloaded again
+        response = await self.client.get(path, headers=self.cache.validators(url))
+        if response.status_code == 304:
+            body = self.cache.refresh(url)
+            if body is not None:
+                self._log(f"Not modified: {url}")
+                return _loads(body, required)
+            response = await self.client.get(path)
+        
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        # Decoded first so a malformed body is never cached
+        data = _loads(response.content, required)
+        self.cache.set(url, response.content,
+                       response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return data
+    
+    async def get_rxcui_from_ndc(self, ndc_code: str) -> Optional[str]:
+        """
+        Get RxCUI from an NDC code.
+        
+        Args:
+            ndc_code: The NDC code (e.g., '00093-7570-98' or '00093757098')
+            
+        Returns:
+            RxCUI identifier or None if not found
+        """
+        # Normalize NDC code
+        ndc_normalized = _normalize_ndc(ndc_code)
+        self._log(f"Looking up RxCUI for NDC code: {ndc_code} (normalized: {ndc_normalized})")
+        
+        path = _PATH_RXCUI % ndc_normalized
+        
+        try:
+            rxcui = _parse_rxcui(await self._cached_get(path, _KEY_RXCUI))
+            
+            if rxcui:
+                self._log(f"Found RxCUI: {rxcui}")
+            else:
+                self._log(f"No RxCUI found for NDC code: {ndc_code}")
+            
+            return rxcui
+            
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Error querying RxNorm API: {e}")
+            return None
+    
+    async def get_rxcuis_from_ndcs(self, ndc_codes: List[str]) -> Dict[str, str]:
+        """
+        Resolve many NDC codes to RxCUIs with one request per batch.
+        
+        Args:
+            ndc_codes: NDC codes in any format
+            
+        Returns:
+            Dictionary of normalized NDC code -> RxCUI
+        """
+        batches = _chunks(list(dict.fromkeys(_normalize_ndc(ndc.strip()) for ndc in ndc_codes)))
+        rxcuis = {}
+        for found in await asyncio.gather(*(self._get_rxcui_batch(batch) for batch in batches)):
+            rxcuis.update(found)
+        return rxcuis
+    
+    async def _get_rxcui_batch(self, ndcs: List[str]) -> Dict[str, str]:
+        """Resolve at most NDC_BATCH_SIZE normalized NDC codes to RxCUIs"""
+        self._log(f"Looking up RxCUIs for NDC codes: {ndcs}")
+        
+        path = _PATH_NDC_PROPERTIES % '+'.join(ndcs)
+        
+        try:
+            found = _parse_ndc_rxcuis(await self._cached_get(path, _KEY_NDC_PROPERTIES), ndcs)
+            self._log(f"Found RxCUIs for {len(found)} of {len(ndcs)} NDC code(s)")
+            return found
+            
+        except (httpx.HTTPError, ValueError) as e:
+            self._log(f"Error looking up NDC properties: {e}")
+            return {}
+    
+    async def get_drug_name(self, rxcui: str) -> Optional[str]:
+        """
+        Get the drug name for an RxCUI.
+        
+        Args:
+            rxcui: The RxNorm Concept Unique Identifier
+            
+        Returns:
+            Drug name or None if not found
+        """
+        path = _PATH_PROPERTIES % rxcui
+        
+        try:
+            name = _parse_drug_name(await self._cached_get(path, _KEY_PROPERTIES))
+            
+            if name:
+                self._log(f"Drug name for RxCUI {rxcui}: {name}")
+                
+            return name
+            
+        except (httpx.HTTPError, ValueError) as e:
+            self._log(f"Error getting drug name: {e}")
+            return None
+    
+    async def get_atc_codes_from_rxcui(self, rxcui: str) -> List[Dict[str, str]]:
+        """
+        Get all ATC codes associated with an RxCUI.
+        
+        Args:
+            rxcui: The RxNorm Concept Unique Identifier
+            
+        Returns:
+            List of dictionaries containing ATC code information
+            Each dict contains: {'atc_code', 'class_name', 'class_type'}
+        """
+        self._log(f"Looking up ATC codes for RxCUI: {rxcui}")
+        
+        path = _PATH_ATC % rxcui
+        
+        try:
+            atc_list = _parse_atc_codes(await self._cached_get(path, _KEY_ATC))
+            
+            if atc_list:
+                self._log(f"Found {len(atc_list)} ATC code(s)")
+            else:
+                self._log(f"No ATC codes found for RxCUI: {rxcui}")
+                
+            return atc_list
+            
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Error querying RxClass API: {e}")
+            return []
+    
+    async def get_related_ingredients(self, rxcui: str) -> List[str]:
+        """
+        Get ingredient-level RxCUIs from a product RxCUI.
+        
+        Args:
+            rxcui: The RxNorm Concept Unique Identifier
+            
+        Returns:
+            List of ingredient RxCUI identifiers
+        """
+        self._log(f"Looking up related ingredients for RxCUI: {rxcui}")
+        
+        path = _PATH_INGREDIENTS % rxcui
+        
+        try:
+            ingredients = _parse_ingredients(await self._cached_get(path, _KEY_INGREDIENTS))
+            
+            if ingredients:
+                self._log(f"Found {len(ingredients)} ingredient(s)")
+            else:
+                self._log(f"No ingredients found for RxCUI: {rxcui}")
+                
+            return ingredients
+            
+        except (httpx.HTTPError, ValueError) as e:
+            self._log(f"Error getting related ingredients: {e}")
+            return []
+    
+    async def convert(self, ndc_code: str, rxcui: Optional[str] = None,
+                      fetch_name: bool = True) -> DrugInfo:
+        """
+        Convert an NDC code to ATC codes.
+        
+        Args:
+            ndc_code: The NDC code to convert (e.g., '00093-7570-98' or '00093757098')
+            rxcui: RxCUI of the NDC if already known (e.g. from get_rxcuis_from_ndcs)
+            fetch_name: If False, skip the drug name request and leave drug_name None
+            
+        Returns:
+            DrugInfo object containing the conversion results
+        """
+        ndc_code = ndc_code.strip()
+        
+        self._log(f"Starting conversion for NDC code: {ndc_code}")
+        
+        # Step 1: Get RxCUI from NDC code
+        if rxcui is None:
+            rxcui = await self.get_rxcui_from_ndc(ndc_code)
+        
+        if not rxcui:
+            return DrugInfo(
+                ndc_code=ndc_code,
+                rxcui=None,
+                drug_name=None,
+                atc_codes=[]
+            )
+        
+        drug_name, atc_codes = await self._lookup_rxcui(rxcui, fetch_name)
         
         return DrugInfo(
             ndc_code=ndc_code,
@@ -294,36 +912,144 @@ class NDCtoATCConverter:
             atc_codes=atc_codes
         )
     
-    def convert_batch(self, ndc_codes: List[str]) -> List[DrugInfo]:
+    async def _lookup_rxcui(self, rxcui: str,
+                            fetch_name: bool = True) -> Tuple[Optional[str], List[Dict[str, str]]]:
         """
-        Convert multiple NDC codes to ATC codes.
+        Get the drug name and ATC codes of an RxCUI.
+        
+        Args:
+            rxcui: The RxNorm Concept Unique Identifier
+            fetch_name: If False, skip the drug name request and return None for it
+            
+        Returns:
+            Tuple of (drug name or None, unique ATC codes)
+        """
+        # Step 2: Get drug name (one request callers can opt out of)
+        drug_name = await self.get_drug_name(rxcui) if fetch_name else None
+        
+        # Step 3: Get ATC codes - first try the product RxCUI
+        atc_codes = await self.get_atc_codes_from_rxcui(rxcui)
+        
+        # Step 4: If no ATC codes found, try ingredient-level RxCUIs
+        # The ingredients are looked up at the same time
+        if not atc_codes:
+            self._log("No ATC codes at product level, checking ingredient level")
+            ingredients = await self.get_related_ingredients(rxcui)
+            ingredient_atc_codes = await asyncio.gather(
+                *(self.get_atc_codes_from_rxcui(ingredient_rxcui) for ingredient_rxcui in ingredients)
+            )
+            atc_codes = [atc for ing_atc_codes in ingredient_atc_codes for atc in ing_atc_codes]
+        
+        return drug_name, _unique_atc_codes(atc_codes)
+    
+    async def convert_batch(self, ndc_codes: List[str], fetch_name: bool = True) -> List[DrugInfo]:
+        """
+        Convert multiple NDC codes to ATC codes concurrently.
+        
+        The RxCUIs of all codes are resolved up front in batched requests;
+        only codes missing from those are looked up one at a time. The name
+        and ATC codes are then looked up once per distinct RxCUI, since many
+        NDCs share one. At most max_concurrency lookups are in flight at
+        once to stay polite towards the RxNorm API. Results are returned in
+        input order.
         
         Args:
             ndc_codes: List of NDC codes to convert
+            fetch_name: If False, skip the drug name requests and leave drug_name None
             
         Returns:
             List of DrugInfo objects
         """
+        ndc_codes = [ndc_code.strip() for ndc_code in ndc_codes]
+        normalized = [_normalize_ndc(ndc_code) for ndc_code in ndc_codes]
+        rxcuis = await self.get_rxcuis_from_ndcs(ndc_codes) if len(ndc_codes) > 1 else {}
+        missing = list(dict.fromkeys(ndc for ndc in normalized if ndc not in rxcuis))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def bounded(coro):
+            async with semaphore:
+                return await coro
+        
+        found = await asyncio.gather(*(bounded(self.get_rxcui_from_ndc(ndc)) for ndc in missing))
+        rxcuis.update((ndc, rxcui) for ndc, rxcui in zip(missing, found) if rxcui)
+        
+        unique_rxcuis = list(dict.fromkeys(rxcuis[ndc] for ndc in normalized if ndc in rxcuis))
+        self._log(f"Looking up {len(unique_rxcuis)} distinct RxCUI(s) for {len(ndc_codes)} NDC code(s)")
+        details = dict(zip(unique_rxcuis, await asyncio.gather(
+            *(bounded(self._lookup_rxcui(rxcui, fetch_name)) for rxcui in unique_rxcuis)
+        )))
+        
         results = []
-        for i, ndc_code in enumerate(ndc_codes, 1):
-            self._log(f"\n--- Processing {i}/{len(ndc_codes)} ---")
-            result = self.convert(ndc_code)
-            results.append(result)
+        for ndc_code, ndc in zip(ndc_codes, normalized):
+            rxcui = rxcuis.get(ndc)
+            drug_name, atc_codes = details[rxcui] if rxcui else (None, [])
+            results.append(DrugInfo(
+                ndc_code=ndc_code,
+                rxcui=rxcui,
+                drug_name=drug_name,
+                atc_codes=list(atc_codes)
+            ))
         return results
 
 
+async def convert_codes_async(ndc_codes: List[str], verbose: bool = False,
+                              max_concurrency: int = 8,
+                              cache: Optional[ResponseCache] = None,
+                              fetch_name: bool = True) -> List[DrugInfo]:
+    """
+    Convert NDC codes with a short-lived AsyncNDCtoATCConverter.
+    
+    Args:
+        ndc_codes: List of NDC codes to convert
+        verbose: If True, print detailed information during conversion
+        max_concurrency: Maximum number of NDC codes converted at once
+        cache: Optional ResponseCache used to skip repeated API calls
+        fetch_name: If False, skip the drug name requests and leave drug_name None
+        
+    Returns:
+        List of DrugInfo objects
+    """
+    async with AsyncNDCtoATCConverter(verbose=verbose, max_concurrency=max_concurrency,
+                                      cache=cache) as converter:
+        return await converter.convert_batch(ndc_codes, fetch_name)
+
+
+def convert_codes(ndc_codes: List[str], verbose: bool = False,
+                  max_concurrency: int = 8,
+                  cache: Optional[ResponseCache] = None,
+                  fetch_name: bool = True) -> List[DrugInfo]:
+    """
+    Synchronous wrapper around convert_codes_async for scripts and the CLI.
+    
+    Args:
+        ndc_codes: List of NDC codes to convert
+        verbose: If True, print detailed information during conversion
+        max_concurrency: Maximum number of NDC codes converted at once
+        cache: Optional ResponseCache used to skip repeated API calls
+        fetch_name: If False, skip the drug name requests and leave drug_name None
+        
+    Returns:
+        List of DrugInfo objects
+    """
+    return asyncio.run(convert_codes_async(ndc_codes, verbose, max_concurrency, cache, fetch_name))
+
+
+@functools.lru_cache(maxsize=65536)
 def format_ndc(ndc: str) -> str:
     """
     Format NDC code in standard 5-4-2 format.
     
+    Results are memoized: batch exports format every code once for the
+    console, and again for the JSON and CSV files.
+    
     Args:
         ndc: Raw NDC code
         
     Returns:
         Formatted NDC code
     """
-    # Remove any existing hyphens
-    ndc_clean = ndc.replace('-', '')
+    # Remove any existing hyphens and spaces
+    ndc_clean = ndc.translate(_NDC_SEPARATORS)
     
     # Try to format as 5-4-2 (most common format)
     if len(ndc_clean) == 11:
@@ -398,12 +1124,62 @@ def save_to_json(results: List[DrugInfo], filename: str):
             'atc_count': len(info.atc_codes)
         })
     
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
+    if orjson is not None:
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
     
     print(f"\n✅ Results saved to: {filename}")
 
 
+# Stands in for the ATC columns of an NDC that has no ATC codes
+_NO_ATC = {'atc_code': '', 'class_name': '', 'class_type': ''}
+
+
+def results_to_columns(results: List[DrugInfo]) -> Dict[str, List[str]]:
+    """
+    Lay out conversion results as columns, one row per NDC and ATC code pair.
+    
+    NDCs without ATC codes get one row with empty ATC columns, and missing
+    RxCUIs or drug names are empty strings, matching save_to_csv(). The
+    result can be passed straight to pandas.DataFrame().
+    
+    Args:
+        results: List of DrugInfo objects
+        
+    Returns:
+        Dictionary mapping column name to its list of values
+    """
+    ndc_codes, ndcs_formatted, rxcuis, drug_names = [], [], [], []
+    atc_codes, class_names, class_types = [], [], []
+    
+    for info in results:
+        atcs = info.atc_codes or (_NO_ATC,)
+        rows = len(atcs)
+        
+        # The NDC columns repeat once per ATC row
+        ndc_codes += [info.ndc_code] * rows
+        ndcs_formatted += [format_ndc(info.ndc_code)] * rows
+        rxcuis += [info.rxcui or ''] * rows
+        drug_names += [info.drug_name or ''] * rows
+        
+        atc_codes += [atc['atc_code'] for atc in atcs]
+        class_names += [atc['class_name'] for atc in atcs]
+        class_types += [atc['class_type'] for atc in atcs]
+    
+    return {
+        'ndc_code': ndc_codes,
+        'ndc_formatted': ndcs_formatted,
+        'rxcui': rxcuis,
+        'drug_name': drug_names,
+        'atc_code': atc_codes,
+        'atc_class_name': class_names,
+        'atc_class_type': class_types,
+    }
+
+
 def save_to_csv(results: List[DrugInfo], filename: str):
     """
     Save conversion results to a CSV file.
@@ -414,32 +1190,13 @@ def save_to_csv(results: List[DrugInfo], filename: str):
     """
     import csv
     
-    with open(filename, 'w', newline='') as f:
+    with open(filename, 'w', newline='', buffering=1 << 20) as f:
         writer = csv.writer(f)
         writer.writerow(['NDC_Code', 'NDC_Formatted', 'RxCUI', 'Drug_Name', 'ATC_Code', 'ATC_Class_Name', 'ATC_Class_Type'])
         
-        for info in results:
-            if info.atc_codes:
-                for atc in info.atc_codes:
-                    writer.writerow([
-                        info.ndc_code,
-                        format_ndc(info.ndc_code),
-                        info.rxcui or '',
-                        info.drug_name or '',
-                        atc['atc_code'],
-                        atc['class_name'],
-                        atc['class_type']
-                    ])
-            else:
-                writer.writerow([
-                    info.ndc_code,
-                    format_ndc(info.ndc_code),
-                    info.rxcui or '',
-                    info.drug_name or '',
-                    '',
-                    '',
-                    ''
-                ])
+        # Rows are zipped from the columns, so the whole table is written
+        # in one writerows call without a per-row Python loop
+        writer.writerows(zip(*results_to_columns(results).values()))
     
     print(f"\n✅ Results saved to: {filename}")
 
@@ -455,8 +1212,11 @@ def main():
 Examples:
   %(prog)s 00093-7570-98                  # Convert single NDC code
   %(prog)s 00093757098 00310759030        # Convert multiple NDC codes
+  %(prog)s 00093757098 00310759030 -w 4   # Convert at most 4 codes at a time
   %(prog)s 00093-7570-98 --output results # Save results to JSON and CSV
   %(prog)s 00093-7570-98 --verbose        # Show detailed processing info
+  %(prog)s 00093-7570-98 --no-cache       # Always query the API, skip the response cache
+  %(prog)s 00093-7570-98 --no-names       # Only look up ATC codes, not the drug name
 
 Common NDC codes for testing:
   00093-7570-98 - Rosuvastatin Calcium 5mg (cholesterol medication)
@@ -478,6 +1238,32 @@ Common NDC codes for testing:
         help='Show verbose output during conversion'
     )
     
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=8,
+        help='Maximum number of NDC codes converted concurrently (default: 8)'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write the on-disk API response cache'
+    )
+    
+    parser.add_argument(
+        '--cache-ttl',
+        type=int,
+        default=DEFAULT_CACHE_TTL,
+        help=f'Age in seconds after which cached API responses are revalidated (default: {DEFAULT_CACHE_TTL})'
+    )
+    
+    parser.add_argument(
+        '--no-names',
+        action='store_true',
+        help='Skip the drug name lookup (one fewer API request per NDC code)'
+    )
+    
     parser.add_argument(
         '-o', '--output',
         type=str,
@@ -498,18 +1284,18 @@ Common NDC codes for testing:
     
     args = parser.parse_args()
     
-    # Create converter
-    converter = NDCtoATCConverter(verbose=args.verbose)
+    cache = None if args.no_cache else ResponseCache(ttl=args.cache_ttl)
+    
+    # Convert codes (concurrently when more than one is given)
+    results = convert_codes(args.ndc_codes, verbose=args.verbose,
+                            max_concurrency=args.workers, cache=cache,
+                            fetch_name=not args.no_names)
     
-    # Convert codes
-    if len(args.ndc_codes) == 1:
+    if len(results) == 1:
         # Single code conversion
-        result = converter.convert(args.ndc_codes[0])
-        print_results(result)
-        results = [result]
+        print_results(results[0])
     else:
         # Batch conversion
-        results = converter.convert_batch(args.ndc_codes)
         for result in results:
             print_results(result, detailed=False)
     
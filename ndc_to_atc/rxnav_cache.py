@@ -0,0 +1 @@
+../rxnav_cache.py
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Persistent on-disk cache of RxNorm API responses.
+
+Shared by the ATC to NDC and NDC to ATC converters (and rxnav_proxy.py),
+so responses either direction fetched are reused by the other. The
+converter directories reach this file through an rxnav_cache.py symlink
+next to each script, so it imports without changes to sys.path.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "atc_ndc" / "rxnav_responses.sqlite"
+DEFAULT_CACHE_TTL = 24 * 60 * 60  # RxNorm data changes at most monthly
+
+
+class ResponseCache:
+    """
+    Persistent on-disk cache of RxNorm API responses.
+    
+    Raw JSON bodies are stored in a SQLite table keyed by the SHA-1 of the
+    request URL, together with the time they were fetched and the ETag /
+    Last-Modified validators the server sent. Entries older than the TTL
+    are revalidated with a conditional GET on the next request; a
+    304 Not Modified reply renews them without downloading the body again.
+    Safe to share between threads.
+    """
+    
+    def __init__(self, path: Optional[Path] = None, ttl: float = DEFAULT_CACHE_TTL):
+        """
+        Open (or create) the cache database.
+        
+        Args:
+            path: SQLite file to use (default: ~/.cache/atc_ndc/rxnav_responses.sqlite)
+            ttl: Maximum age of a cached response in seconds
+        """
+        self.path = Path(path) if path else DEFAULT_CACHE_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body BLOB NOT NULL, fetched_at REAL NOT NULL, "
+            "etag TEXT, last_modified TEXT)"
+        )
+        # Caches created before validators were stored lack the two columns
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        for column in ('etag', 'last_modified'):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE responses ADD COLUMN {column} TEXT")
+        self._conn.commit()
+    
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+    
+    def get(self, url: str) -> Optional[bytes]:
+        """Return the cached body for url, or None if missing or expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, fetched_at FROM responses WHERE key = ?", (self._key(url),)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+    
+    def validators(self, url: str) -> Dict[str, str]:
+        """Return conditional request headers for a cached (possibly expired) url"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified FROM responses WHERE key = ?", (self._key(url),)
+            ).fetchone()
+        headers = {}
+        if row is not None:
+            if row[0]:
+                headers['If-None-Match'] = row[0]
+            if row[1]:
+                headers['If-Modified-Since'] = row[1]
+        return headers
+    
+    def refresh(self, url: str) -> Optional[bytes]:
+        """Mark the entry for url as fresh after a 304 and return its body"""
+        key = self._key(url)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            row = self._conn.execute(
+                "SELECT body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def set(self, url: str, body: bytes, etag: Optional[str] = None,
+            last_modified: Optional[str] = None):
+        """Store the response body for url, with its validators if known"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, fetched_at, etag, last_modified) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self._key(url), body, time.time(), etag, last_modified)
+            )
+            self._conn.commit()
+    
+    def close(self):
+        self._conn.close()